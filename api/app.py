@@ -13,8 +13,13 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.responses import PlainTextResponse
 
 from service.player_lookup import search_players
-from service.nba_fetch import get_daily_leaders, get_player_time_series
+from service.nba_fetch import get_daily_leaders, get_player_time_series, get_range_leaders
 from service.player_baselines import get_player_baselines_v1
+from service.team_eval import evaluate_rosters, scan_trades, trade_candidates, count_trade_candidates
+from service.similarity import similar_players
+from service.bq_exec import QueryCostExceeded, recent_jobs
+from service.data_version import date_version, range_version, season_version
+from service.http_cache import cached_json_response
 app = FastAPI(openapi_url="/openapi.json", docs_url="/docs")
 
 app.add_middleware(
@@ -26,6 +31,10 @@ app.add_middleware(
 
 v1 = APIRouter(prefix="/v1", tags=["v1"])
 
+@app.exception_handler(QueryCostExceeded)
+def query_cost_exceeded_handler(request: Request, exc: QueryCostExceeded):
+    return JSONResponse(status_code=503, content={"detail": f"Query rejected by cost guardrail: {exc}"})
+
 # ----------------------------
 # helpers
 # ----------------------------
@@ -40,6 +49,19 @@ def sanitize_response(obj):
         return obj
     return obj
 
+def _versioned_json(request: Request, endpoint: str, params: dict, version, build, max_age: int):
+    return cached_json_response(
+        request, endpoint, params, version,
+        lambda: jsonable_encoder(sanitize_response(build())),
+        max_age,
+    )
+
+def _parse_ids(s: str) -> List[int]:
+    ids = [int(x) for x in re.findall(r"\d+", s or "")]
+    if not ids:
+        raise HTTPException(status_code=400, detail=f"Invalid player id list '{s}'. Use comma-separated integers.")
+    return ids
+
 def _parse_date(s: str) -> date:
     try:
         return datetime.strptime(s, "%Y-%m-%d").date()
@@ -53,6 +75,17 @@ def _parse_date(s: str) -> date:
 def health():
     return {"status": "ok", "service": "nba-gbq-api"}
 
+@app.get("/health/bq", operation_id="bqJobStats", include_in_schema=False)
+def health_bq():
+    jobs = recent_jobs()
+    return {
+        "jobs": len(jobs),
+        "cache_hits": sum(1 for j in jobs if j.get("cache_hit")),
+        "bytes_billed": sum(j.get("bytes_billed") or 0 for j in jobs),
+        "over_scan": [j for j in jobs if j.get("over_scan")],
+        "recent": jobs[-20:],
+    }
+
 # ----------------------------
 # /v1 endpoints
 # ----------------------------
@@ -66,27 +99,64 @@ def players_search_endpoint(
 
 @v1.get("/daily_leaders", operation_id="getDailyLeaders")
 def daily_leaders(
+    request: Request,
     game_date: date = Query(default=date.today() - timedelta(days=1)),
     limit: int = Query(default=10, ge=1, le=50),
     mode: str = Query(default="best", pattern=r"^(best|worst)$"),
     min_minutes: int = Query(default=20, ge=0),
 ):
-    try:
-        leaders = get_daily_leaders(game_date, limit, mode, min_minutes=min_minutes)
-    except TypeError:
-        leaders = get_daily_leaders(game_date, limit, mode)
-
-    payload = {
-        "date": str(game_date),
-        "limit": limit,
-        "mode": mode,
-        "min_minutes": min_minutes,
-        "leaders": leaders,
-    }
-    return JSONResponse(
-        content=jsonable_encoder(sanitize_response(payload)),
-        headers={"Cache-Control": "public, max-age=600"},
-    )
+    def build():
+        try:
+            leaders = get_daily_leaders(game_date, limit, mode, min_minutes=min_minutes)
+        except TypeError:
+            leaders = get_daily_leaders(game_date, limit, mode)
+
+        return {
+            "date": str(game_date),
+            "limit": limit,
+            "mode": mode,
+            "min_minutes": min_minutes,
+            "leaders": leaders,
+        }
+
+    params = {"game_date": game_date, "limit": limit, "mode": mode, "min_minutes": min_minutes}
+    return _versioned_json(request, "daily_leaders", params, date_version(game_date), build, 600)
+
+@v1.get(
+    "/range_leaders",
+    operation_id="getRangeLeaders",
+    description="Rank players by average z-score over a window (e.g. last 7/14/30 days ending at end_date)."
+)
+def range_leaders(
+    request: Request,
+    end_date: Optional[date] = Query(None, description="YYYY-MM-DD, default yesterday"),
+    days: int = Query(default=7, ge=1, le=200),
+    start_date: Optional[str] = Query(None, description="YYYY-MM-DD; overrides days"),
+    limit: int = Query(default=10, ge=1, le=50),
+    mode: str = Query(default="best", pattern=r"^(best|worst)$"),
+    min_games: int = Query(default=1, ge=1),
+    min_minutes: float = Query(default=20, ge=0),
+):
+    end_date = end_date or date.today() - timedelta(days=1)  # per request, not at import
+    s_date = _parse_date(start_date) if start_date else end_date - timedelta(days=days - 1)
+    if s_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date.")
+
+    def build():
+        return {
+            "start_date": str(s_date),
+            "end_date": str(end_date),
+            "limit": limit,
+            "mode": mode,
+            "min_games": min_games,
+            "min_minutes": min_minutes,
+            "leaders": get_range_leaders(s_date, end_date, limit, mode,
+                                         min_games=min_games, min_minutes=min_minutes),
+        }
+
+    params = {"start_date": s_date, "end_date": end_date, "limit": limit, "mode": mode,
+              "min_games": min_games, "min_minutes": min_minutes}
+    return _versioned_json(request, "range_leaders", params, range_version(s_date, end_date), build, 600)
 
 @v1.get(
     "/player_timeseries",
@@ -114,15 +184,14 @@ def player_timeseries(
     s_date = _parse_date(start_date)
     e_date = _parse_date(end_date)
 
-    ts = get_player_time_series(pid, s_date, e_date)
-    if isinstance(ts, list) and limit:
-        ts = ts[:limit]
+    def build():
+        ts = get_player_time_series(pid, s_date, e_date)
+        if isinstance(ts, list) and limit:
+            ts = ts[:limit]
+        return {"player_id": pid, "start_date": s_date, "end_date": e_date, "series": ts}
 
-    payload = {"player_id": pid, "start_date": s_date, "end_date": e_date, "series": ts}
-    return JSONResponse(
-        content=jsonable_encoder(sanitize_response(payload)),
-        headers={"Cache-Control": "public, max-age=600"},
-    )
+    params = {"player_id": pid, "start_date": s_date, "end_date": e_date, "limit": limit}
+    return _versioned_json(request, "player_timeseries", params, range_version(s_date, e_date), build, 600)
 
 @v1.get(
     "/player_baselines",
@@ -130,6 +199,7 @@ def player_timeseries(
     description="Season + last-5 baselines with weighted FG/FT and usage proxy. Single player_id."
 )
 def player_baselines_v1_endpoint(
+    request: Request,
     player_id: str = Query(..., description="Single player ID (integer)"),
     season: str = Query(..., pattern=r"^\d{4}-\d{2}$"),
     window: int = Query(5, ge=3, le=10),
@@ -139,17 +209,113 @@ def player_baselines_v1_endpoint(
         raise HTTPException(status_code=400, detail=f"Invalid player_id '{player_id}'. Must be an integer.")
     pid = int(m.group(0))
 
-    try:
-        data = get_player_baselines_v1(pid, season, window)
+    def build():
+        try:
+            data = get_player_baselines_v1(pid, season, window)
+            if data is None:
+                raise HTTPException(status_code=404, detail="No data for player/season.")
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return data
+
+    params = {"player_id": pid, "season": season, "window": window}
+    return _versioned_json(request, "player_baselines", params, season_version(season), build, 3600)
+
+@v1.get(
+    "/team_eval",
+    operation_id="teamEvalV1",
+    description="Compare two rosters (comma-separated player_ids): 9-cat z totals, deltas and punt views."
+)
+def team_eval_endpoint(
+    request: Request,
+    roster_a: str = Query(..., description="Comma-separated player IDs, e.g. current team"),
+    roster_b: str = Query(..., description="Comma-separated player IDs, e.g. team after the trade"),
+    season: str = Query(..., pattern=r"^\d{4}-\d{2}$"),
+):
+    ids_a, ids_b = _parse_ids(roster_a), _parse_ids(roster_b)
+
+    def build():
+        data = evaluate_rosters(season, ids_a, ids_b)
+        if data is None:
+            raise HTTPException(status_code=404, detail="No data for season.")
+        return data
+
+    params = {"roster_a": ids_a, "roster_b": ids_b, "season": season}
+    return _versioned_json(request, "team_eval", params, season_version(season), build, 3600)
+
+# Upper bound on candidates /v1/trade_scan enumerates per request
+MAX_TRADE_CANDIDATES = 20000
+
+@v1.get(
+    "/trade_scan",
+    operation_id="tradeScanV1",
+    description="Score every 1..max_give for 1..max_get trade between roster and targets "
+                "(comma-separated player_ids) by signed 9-cat z change; returns the best ones."
+)
+def trade_scan_endpoint(
+    request: Request,
+    roster: str = Query(..., description="Comma-separated player IDs you could give"),
+    targets: str = Query(..., description="Comma-separated player IDs you could get (e.g. another team)"),
+    season: str = Query(..., pattern=r"^\d{4}-\d{2}$"),
+    max_give: int = Query(2, ge=1, le=3),
+    max_get: int = Query(2, ge=1, le=3),
+    punt: Optional[str] = Query(None, description="Comma-separated categories to ignore, e.g. FT%,turnovers"),
+    top: int = Query(20, ge=1, le=100),
+):
+    ids_give, ids_get = _parse_ids(roster), _parse_ids(targets)
+    punt_cats = sorted({c.strip() for c in (punt or "").split(",") if c.strip()})
+    ids_give, ids_get = list(dict.fromkeys(ids_give)), list(dict.fromkeys(ids_get))
+    n = count_trade_candidates(len(ids_give), len(ids_get), max_give, max_get)
+    if n > MAX_TRADE_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"{n} candidate trades; narrow roster/targets "
+                                                    f"or max_give/max_get (limit {MAX_TRADE_CANDIDATES}).")
+    gives, gets = trade_candidates(ids_give, ids_get, max_give, max_get)
+
+    def build():
+        try:
+            trades = scan_trades(season, gives, gets, punt=punt_cats, top=top)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if trades is None:
+            raise HTTPException(status_code=404, detail="No data for season.")
+        return {"season": season, "candidates": len(gives), "punt": punt_cats, "trades": trades}
+
+    params = {"roster": ids_give, "targets": ids_get, "season": season, "max_give": max_give,
+              "max_get": max_get, "punt": ",".join(punt_cats), "top": top}
+    return _versioned_json(request, "trade_scan", params, season_version(season), build, 3600)
+
+@v1.get(
+    "/similar_players",
+    operation_id="similarPlayersV1",
+    description="Players with the most similar 9-cat z profile this season (cosine or euclidean). Single player_id."
+)
+def similar_players_endpoint(
+    request: Request,
+    player_id: str = Query(..., description="Single player ID (integer)"),
+    season: str = Query(..., pattern=r"^\d{4}-\d{2}$"),
+    k: int = Query(10, ge=1, le=50),
+    metric: str = Query("cosine", pattern=r"^(cosine|euclidean)$"),
+    min_games: int = Query(0, ge=0),
+    punt: Optional[str] = Query(None, description="Comma-separated categories to ignore, e.g. FT%,turnovers"),
+):
+    m = re.search(r"\d+", player_id or "")
+    if not m:
+        raise HTTPException(status_code=400, detail=f"Invalid player_id '{player_id}'. Must be an integer.")
+    pid = int(m.group(0))
+    punt_cats = sorted({c.strip() for c in (punt or "").split(",") if c.strip()})
+
+    def build():
+        try:
+            data = similar_players(season, pid, k=k, metric=metric, min_games=min_games, punt=punt_cats)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         if data is None:
             raise HTTPException(status_code=404, detail="No data for player/season.")
-    except ValueError as e:
-        raise HTTPException(400, str(e))
+        return data
 
-    return JSONResponse(
-        content=jsonable_encoder(sanitize_response(data)),
-        headers={"Cache-Control": "public, max-age=3600"},
-    )
+    params = {"player_id": pid, "season": season, "k": k, "metric": metric,
+              "min_games": min_games, "punt": ",".join(punt_cats)}
+    return _versioned_json(request, "similar_players", params, season_version(season), build, 3600)
 
 # mount versioned router
 app.include_router(v1)
\ No newline at end of file
@@ -0,0 +1,173 @@
+# service/bq_exec.py
+"""
+Guarded BigQuery execution: per-endpoint maximum_bytes_billed caps, optional
+dry-run estimation, and per-job stats (cache hit, bytes, slot-ms, latency).
+
+Jobs that scan noticeably more than their expected number of game_date
+partitions are flagged in the log, so a badly filtered request shows up. The
+per-partition budget counts only the columns the query reads (dry-run estimate).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from google.api_core.exceptions import GoogleAPICallError
+from google.cloud import bigquery
+
+log = logging.getLogger("bq")
+
+MB = 1024 ** 2
+
+# Per-endpoint bytes-billed caps; override with BQ_MAX_BYTES_<ENDPOINT>, e.g. BQ_MAX_BYTES_RANGE_LEADERS
+DEFAULT_MAX_BYTES = int(os.getenv("BQ_MAX_BYTES_BILLED", str(2048 * MB)))
+ENDPOINT_MAX_BYTES = {
+    "daily_leaders": 200 * MB,
+    "player_timeseries": 500 * MB,
+    "range_leaders": 1024 * MB,
+    "season_games": 2048 * MB,
+    "league_baseline": 50 * MB,
+    "player_baselines": 1024 * MB,
+}
+
+DRY_RUN_FIRST = os.getenv("BQ_DRY_RUN_FIRST", "0") == "1"
+PARTITION_SLACK = float(os.getenv("BQ_PARTITION_SLACK", "1.5"))
+PARTITION_STATS_TTL_SECONDS = 24 * 3600
+
+_recent = deque(maxlen=200)
+_partition_bytes: Dict[Tuple[str, tuple], tuple] = {}  # (table, columns) -> (avg bytes per partition, fetched_at)
+_lock = threading.Lock()
+
+
+class QueryCostExceeded(RuntimeError):
+    """The query would bill more bytes than the endpoint's cap (dry-run estimate or BigQuery's own check)."""
+
+
+def max_bytes_for(endpoint: str) -> int:
+    env = os.getenv(f"BQ_MAX_BYTES_{endpoint.upper()}")
+    if env:
+        return int(env)
+    return ENDPOINT_MAX_BYTES.get(endpoint, DEFAULT_MAX_BYTES)
+
+def recent_jobs() -> List[dict]:
+    return list(_recent)
+
+def _over_cap(e: GoogleAPICallError) -> bool:
+    """True when BigQuery failed the job for exceeding maximum_bytes_billed."""
+    reasons = [err.get("reason") for err in (getattr(e, "errors", None) or []) if isinstance(err, dict)]
+    return "bytesBilledLimitExceeded" in reasons or "bytesBilledLimitExceeded" in str(e)
+
+def _record(stats: dict):
+    _recent.append(stats)
+    level = logging.WARNING if stats.get("over_scan") or stats.get("rejected") else logging.INFO
+    log.log(level, json.dumps(stats, default=str))
+
+def avg_partition_bytes(client: bigquery.Client, table: str, columns: Sequence[str] = ()) -> Optional[float]:
+    """
+    Average bytes per partition of a `project.dataset.table` for the given columns
+    (all columns when empty), cached for a day. Column bytes come from a free dry run.
+    """
+    key = (table, tuple(sorted(columns)))
+    with _lock:
+        hit = _partition_bytes.get(key)
+        if hit is not None and time.time() - hit[1] < PARTITION_STATS_TTL_SECONDS:
+            return hit[0]
+
+    project, dataset, name = table.split(".")
+    sql = f"""
+    SELECT COUNT(*) AS partitions, SUM(total_logical_bytes) AS total_bytes
+    FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+    WHERE table_name = @t AND partition_id NOT IN ('__NULL__', '__UNPARTITIONED__')
+    """
+    try:
+        rows = list(client.query(sql, job_config=bigquery.QueryJobConfig(
+            query_parameters=[bigquery.ScalarQueryParameter("t", "STRING", name)]
+        )).result())
+        partitions, total = (rows[0]["partitions"], rows[0]["total_bytes"]) if rows else (0, None)
+        if columns and partitions:
+            dry = client.query(
+                f"SELECT {', '.join(f'`{c}`' for c in columns)} FROM `{table}`",
+                job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False),
+            )
+            total = dry.total_bytes_processed
+        avg = float(total) / partitions if partitions and total else None
+    except Exception as e:
+        log.warning("partition stats unavailable for %s: %s", table, e)
+        avg = None
+
+    with _lock:
+        _partition_bytes[key] = (avg, time.time())
+    return avg
+
+def run_query(client: bigquery.Client,
+              sql: str,
+              params: Sequence = (),
+              endpoint: str = "default",
+              location: Optional[str] = None,
+              expected_partitions: Optional[int] = None,
+              tables: Optional[Mapping[str, Sequence[str]]] = None,
+              dry_run: Optional[bool] = None):
+    """
+    Run a query under the endpoint's bytes-billed cap and wait for it.
+    Returns the finished QueryJob (call .to_dataframe() / .result() on it).
+
+    expected_partitions/tables: how many game_date partitions the query should touch,
+    and {table: columns read} for the partitioned tables it scans; bytes beyond that
+    (times BQ_PARTITION_SLACK) are flagged.
+    """
+    cap = max_bytes_for(endpoint)
+    stats = {"endpoint": endpoint, "max_bytes_billed": cap}
+
+    if DRY_RUN_FIRST if dry_run is None else dry_run:
+        dry = client.query(
+            sql,
+            job_config=bigquery.QueryJobConfig(query_parameters=list(params), dry_run=True,
+                                               use_query_cache=False),
+            location=location,
+        )
+        stats["estimated_bytes"] = dry.total_bytes_processed
+        if dry.total_bytes_processed and dry.total_bytes_processed > cap:
+            stats["rejected"] = True
+            _record(stats)
+            raise QueryCostExceeded(
+                f"{endpoint}: estimated {dry.total_bytes_processed} bytes exceeds cap of {cap}"
+            )
+
+    t0 = time.perf_counter()
+    job = client.query(
+        sql,
+        job_config=bigquery.QueryJobConfig(query_parameters=list(params), maximum_bytes_billed=cap),
+        location=location,
+    )
+    try:
+        job.result()
+    except GoogleAPICallError as e:
+        if not _over_cap(e):
+            raise
+        stats.update({"job_id": job.job_id, "rejected": True,
+                      "latency_ms": round((time.perf_counter() - t0) * 1000, 1)})
+        _record(stats)
+        raise QueryCostExceeded(f"{endpoint}: query exceeds bytes-billed cap of {cap}") from e
+
+    stats.update({
+        "job_id": job.job_id,
+        "cache_hit": job.cache_hit,
+        "bytes_processed": job.total_bytes_processed,
+        "bytes_billed": job.total_bytes_billed,
+        "slot_ms": job.slot_millis,
+        "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+    })
+
+    if expected_partitions and tables and not job.cache_hit and job.total_bytes_processed:
+        per_partition = [avg_partition_bytes(client, t, cols) for t, cols in tables.items()]
+        if all(per_partition):
+            budget = expected_partitions * sum(per_partition) * PARTITION_SLACK
+            stats["expected_partitions"] = expected_partitions
+            stats["scanned_partitions_est"] = round(job.total_bytes_processed / sum(per_partition), 1)
+            stats["over_scan"] = job.total_bytes_processed > budget
+
+    _record(stats)
+    return job
@@ -0,0 +1,85 @@
+# service/data_version.py
+"""
+Data versions stamped by ingest into nba_data.data_versions, one per (season, game_date).
+
+Read with one small query at most every DATA_VERSION_TTL_SECONDS per process.
+Functions return None when versions are unavailable (e.g. the table is missing) or
+nothing asked for has been stamped yet, so callers fall back to time-based freshness
+instead of pinning a version that never changes.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from .bq_exec import run_query
+from .nba_fetch import PROJECT_ID, DATASET, get_client
+
+VERSION_TTL_SECONDS = int(os.getenv("DATA_VERSION_TTL_SECONDS", "60"))
+TABLE_VERSIONS = f"{PROJECT_ID}.{DATASET}.data_versions"
+
+_state = {"fetched_at": 0.0, "dates": None, "seasons": None, "season_dates": None}
+_lock = threading.Lock()
+
+def _hash(parts) -> str:
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def _load():
+    sql = f"""
+    SELECT season, game_date, ARRAY_AGG(version ORDER BY loaded_at DESC LIMIT 1)[OFFSET(0)] AS version
+    FROM `{TABLE_VERSIONS}`
+    GROUP BY season, game_date
+    """
+    try:
+        rows = list(run_query(get_client(), sql, endpoint="data_versions").result())
+    except Exception as e:
+        logging.warning(f"data versions unavailable: {e}")
+        return None, None, None
+
+    dates: Dict[date, str] = {}
+    season_dates: Dict[str, Dict[date, str]] = {}
+    for r in rows:
+        dates[r["game_date"]] = r["version"]
+        season_dates.setdefault(r["season"], {})[r["game_date"]] = r["version"]
+    # a season's version changes whenever any of its dates is re-stamped
+    seasons = {s: _hash(sorted(f"{d}={v}" for d, v in dv.items())) for s, dv in season_dates.items()}
+    return dates, seasons, season_dates
+
+def _versions():
+    with _lock:
+        if time.time() - _state["fetched_at"] >= VERSION_TTL_SECONDS:
+            _state["dates"], _state["seasons"], _state["season_dates"] = _load()
+            _state["fetched_at"] = time.time()
+        return _state["dates"], _state["seasons"], _state["season_dates"]
+
+def date_version(d: date) -> Optional[str]:
+    dates, _, _ = _versions()
+    if dates is None:
+        return None
+    return dates.get(d)
+
+def range_version(start: date, end: date) -> Optional[str]:
+    dates, _, _ = _versions()
+    if dates is None:
+        return None
+    stamped = sorted(f"{d}={v}" for d, v in dates.items() if start <= d <= end)
+    return _hash(stamped) if stamped else None
+
+def season_version(season: str) -> Optional[str]:
+    _, seasons, _ = _versions()
+    if seasons is None:
+        return None
+    return seasons.get(season)
+
+def season_versions(season: str) -> Tuple[Optional[str], Optional[Dict[date, str]]]:
+    """
+    season_version(season) plus game_date -> version for each of its stamped dates,
+    read from the same load so the two always agree.
+    """
+    _, seasons, season_dates = _versions()
+    if seasons is None:
+        return None, None
+    return seasons.get(season), dict(season_dates.get(season, {}))
@@ -0,0 +1,103 @@
+# service/http_cache.py
+"""
+Strong ETags from (endpoint, query params, data version), 304 handling for
+If-None-Match, and an LRU of serialized + precompressed bodies keyed by ETag.
+
+Each content coding gets its own validator ("<hash>", "<hash>-gzip", "<hash>-br"),
+so caches never mix up representations.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from fastapi import Request, Response
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+BODY_CACHE_SIZE = int(os.getenv("HTTP_BODY_CACHE_SIZE", "512"))
+MIN_COMPRESS_BYTES = 512
+
+_bodies: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+_lock = threading.Lock()
+
+def make_etag(endpoint: str, params: dict, version: str) -> str:
+    key = json.dumps([endpoint, sorted((k, str(v)) for k, v in params.items()), version])
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+def _etag_for(etag: str, encoding: str) -> str:
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+def _not_modified(request: Request, etag: str) -> Optional[str]:
+    """The If-None-Match tag matching any coding of etag, if there is one."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    variants = {_etag_for(etag, enc) for enc in ("identity", "gzip", "br")}
+    for tag in (t.strip() for t in header.split(",")):
+        if tag == "*":
+            return etag
+        if tag.removeprefix("W/") in variants:
+            return tag.removeprefix("W/")
+    return None
+
+def _encode(content) -> Dict[str, bytes]:
+    # same serialization as JSONResponse
+    raw = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+    bodies = {"identity": raw}
+    if len(raw) >= MIN_COMPRESS_BYTES:
+        bodies["gzip"] = gzip.compress(raw, compresslevel=6)
+        if brotli is not None:
+            bodies["br"] = brotli.compress(raw, quality=5)
+    return bodies
+
+def _pick_encoding(request: Request, bodies: Dict[str, bytes]) -> str:
+    accepted = {e.split(";")[0].strip() for e in request.headers.get("accept-encoding", "").split(",")}
+    for enc in ("br", "gzip"):
+        if enc in accepted and enc in bodies:
+            return enc
+    return "identity"
+
+def cached_json_response(request: Request,
+                         endpoint: str,
+                         params: dict,
+                         version: Optional[str],
+                         build: Callable[[], object],
+                         max_age: int) -> Response:
+    """
+    build() returns JSON-ready content and only runs when the body isn't cached.
+    Without a data version the ETag rolls over every max_age seconds.
+    """
+    if version is None:
+        version = f"t{int(time.time() // max_age)}"
+    etag = make_etag(endpoint, params, version)
+    headers = {"Cache-Control": f"public, max-age={max_age}", "Vary": "Accept-Encoding"}
+
+    matched = _not_modified(request, etag)
+    if matched:
+        headers["ETag"] = matched
+        return Response(status_code=304, headers=headers)
+
+    with _lock:
+        bodies = _bodies.get(etag)
+        if bodies is not None:
+            _bodies.move_to_end(etag)
+    if bodies is None:
+        bodies = _encode(build())
+        with _lock:
+            _bodies[etag] = bodies
+            while len(_bodies) > BODY_CACHE_SIZE:
+                _bodies.popitem(last=False)
+
+    enc = _pick_encoding(request, bodies)
+    headers["ETag"] = _etag_for(etag, enc)
+    if enc != "identity":
+        headers["Content-Encoding"] = enc
+    return Response(content=bodies[enc], media_type="application/json", headers=headers)
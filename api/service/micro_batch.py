@@ -0,0 +1,71 @@
+# service/micro_batch.py
+"""
+Dataloader-style coalescing of concurrent single-key lookups.
+
+The first caller in a window becomes the leader: it waits window_ms, takes every
+key submitted meanwhile, runs one batch function and hands each waiter its own
+result (or the batch's exception). Endpoints run in FastAPI's threadpool, so
+followers simply block on an Event.
+"""
+import threading
+import time
+from typing import Callable, Hashable, List, Sequence
+
+
+class _Batch:
+    def __init__(self):
+        self.keys: List[Hashable] = []
+        self.results: list = []
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[Sequence[Hashable]], list], window_ms: float, max_batch: int = 50):
+        """
+        run_batch(keys) must return one result per key, in order. A result that is an
+        Exception is raised to that key's caller only.
+        """
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def load(self, key: Hashable):
+        if self.window <= 0:
+            result = self.run_batch([key])[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with self._lock:
+            leader = self._pending is None
+            if leader:
+                self._pending = _Batch()
+            batch = self._pending
+            idx = len(batch.keys)
+            batch.keys.append(key)
+            if len(batch.keys) >= self.max_batch:
+                self._pending = None  # full: later callers start a new batch
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.results = self.run_batch(list(batch.keys))
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        result = batch.results[idx]
+        if isinstance(result, Exception):
+            raise result
+        return result
@@ -1,15 +1,31 @@
 from google.cloud import bigquery
+from datetime import date
 import os
 import pandas as pd
 import numpy as np
 
+from .bq_exec import run_query
+from .micro_batch import MicroBatcher
+
 PROJECT_ID = os.getenv("PROJECT_ID", "fantasy-survivor-app")
 DATASET = "nba_data"
 TABLE = "player_daily_game_stats_p"
+HIST_TABLE = "player_historical_game_stats_p"
+DAILY_FQN = f"{PROJECT_ID}.{DATASET}.{TABLE}"
+HIST_FQN = f"{PROJECT_ID}.{DATASET}.{HIST_TABLE}"
+
+# Columns each query reads, for the over-scan budget in run_query
+BOX_COLS = ["player_id", "game_date", "game_id", "pts", "reb", "ast", "stl", "blk", "fg3m",
+            "fg_pct", "ft_pct", "turnovers", "z_score"]
+LEADER_COLS = BOX_COLS + ["player_name", "min"]
+HIST_USAGE_COLS = ["player_id", "game_date", "fg_attempts", "ft_attempts"]
 
 def get_client():
     return bigquery.Client(project=PROJECT_ID)
 
+def _days(start_date, end_date):
+    return (end_date - start_date).days + 1 if start_date and end_date else None
+
 def safe_records(df: pd.DataFrame):
     """
     Convert NaN/Inf values into None so JSON serialization won't fail.
@@ -17,7 +33,16 @@ def safe_records(df: pd.DataFrame):
     df = df.replace([np.inf, -np.inf], np.nan)       # replace +/- inf with NaN
     return df.where(df.notnull(), None).to_dict("records")  # NaN -> None
 
+def _season_store():
+    # imported lazily: season_store imports this module
+    from .season_store import get_store
+    return get_store()
+
 def get_daily_leaders(date, limit=10, mode="best"):
+    store = _season_store()
+    if store is not None and store.covers(date):
+        return store.daily_leaders(date, limit, mode)
+
     client = get_client()
 
     order = "DESC" if mode == "best" else "ASC"
@@ -39,38 +64,193 @@ def get_daily_leaders(date, limit=10, mode="best"):
     LIMIT @limit
     """
 
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("date", "DATE", date),
-            bigquery.ScalarQueryParameter("limit", "INT64", limit),
-        ]
-    )
-    df = client.query(query, job_config=job_config).to_dataframe()
+    params = [
+        bigquery.ScalarQueryParameter("date", "DATE", date),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    df = run_query(client, query, params, endpoint="daily_leaders",
+                   expected_partitions=1, tables={DAILY_FQN: LEADER_COLS}).to_dataframe()
     return safe_records(df)
 
 def get_player_time_series(player_id, start_date=None, end_date=None):
+    store = _season_store()
+    if store is not None and store.covers(start_date, end_date):
+        return store.player_time_series(player_id, start_date, end_date)
+    return _ts_batcher.load((int(player_id), start_date, end_date))
+
+def _range_groups(keys, gap_days):
+    """
+    Indexes of keys grouped so that each group's date ranges overlap or are at most
+    gap_days apart; an open start/end extends to the edge of time.
+    """
+    lo = lambda k: k[1] or date.min
+    hi = lambda k: k[2] or date.max
+    order = sorted(range(len(keys)), key=lambda i: lo(keys[i]))
+    groups, end = [], None
+    for i in order:
+        if groups and (end == date.max or (lo(keys[i]) - end).days <= gap_days):
+            groups[-1].append(i)
+            end = max(end, hi(keys[i]))
+        else:
+            groups.append([i])
+            end = hi(keys[i])
+    return groups
+
+def _time_series_batch(keys):
+    """
+    Coalesced requests grouped by nearby date ranges (TS_BATCH_GAP_DAYS), one query per
+    group, so an old-season request doesn't widen this week's scan. A failing group
+    only fails its own waiters.
+    """
+    out = [None] * len(keys)
+    for group in _range_groups(keys, TS_BATCH_GAP_DAYS):
+        try:
+            results = _time_series_query([keys[i] for i in group])
+        except Exception as e:
+            results = [e] * len(group)
+        for i, r in zip(group, results):
+            out[i] = r
+    return out
+
+def _time_series_query(keys):
+    """
+    One query for many (player_id, start, end) requests: player_id IN UNNEST(@ids)
+    over the union of their date ranges, then rows are split back per request.
+    """
     client = get_client()
-    conditions = ["player_id = @pid"]
-    params = [bigquery.ScalarQueryParameter("pid", "INT64", player_id)]
+    ids = sorted({pid for pid, _, _ in keys})
+    starts = [s for _, s, _ in keys]
+    ends = [e for _, _, e in keys]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
 
-    if start_date:
+    conditions = ["player_id IN UNNEST(@ids)"]
+    params = [bigquery.ArrayQueryParameter("ids", "INT64", ids)]
+    if start:
         conditions.append("game_date >= @start")
-        params.append(bigquery.ScalarQueryParameter("start", "DATE", start_date))
-    if end_date:
+        params.append(bigquery.ScalarQueryParameter("start", "DATE", start))
+    if end:
         conditions.append("game_date <= @end")
-        params.append(bigquery.ScalarQueryParameter("end", "DATE", end_date))
+        params.append(bigquery.ScalarQueryParameter("end", "DATE", end))
 
     where_clause = " AND ".join(conditions)
 
     query = f"""
     SELECT 
-      game_date, game_id,
+      player_id, game_date, game_id,
       pts, reb, ast, stl, blk, fg3m, fg_pct, ft_pct, turnovers,
       z_score
     FROM `{PROJECT_ID}.{DATASET}.{TABLE}`
     WHERE {where_clause}
-    ORDER BY game_date ASC
+    ORDER BY player_id, game_date ASC
+    """
+    df = run_query(client, query, params, endpoint="player_timeseries",
+                   expected_partitions=_days(start, end), tables={DAILY_FQN: BOX_COLS}).to_dataframe()
+
+    by_player = {pid: g.drop(columns="player_id") for pid, g in df.groupby("player_id", sort=False)}
+    empty = df.drop(columns="player_id").iloc[0:0]
+    out = []
+    for pid, s, e in keys:
+        g = by_player.get(pid, empty)
+        dates = pd.to_datetime(g["game_date"]).dt.date
+        mask = np.ones(len(g), dtype=bool)
+        if s:
+            mask &= (dates >= s).to_numpy()
+        if e:
+            mask &= (dates <= e).to_numpy()
+        out.append(safe_records(g[mask]))
+    return out
+
+# Concurrent timeseries requests within TS_BATCH_WINDOW_MS share BigQuery jobs (0 disables):
+# one per group of date ranges no more than TS_BATCH_GAP_DAYS apart.
+TS_BATCH_GAP_DAYS = int(os.getenv("TS_BATCH_GAP_DAYS", "14"))
+_ts_batcher = MicroBatcher(
+    _time_series_batch,
+    window_ms=float(os.getenv("TS_BATCH_WINDOW_MS", "10")),
+    max_batch=int(os.getenv("TS_BATCH_MAX", "50")),
+)
+
+def get_range_leaders(start_date, end_date, limit=10, mode="best", min_games=1, min_minutes=0):
+    """
+    Rank players by z-score over a date window in a single grouped query.
+    min_minutes applies to the player's average minutes across the window.
+    """
+    client = get_client()
+
+    order = "DESC" if mode == "best" else "ASC"
+
+    query = f"""
+    SELECT
+      player_id,
+      ANY_VALUE(player_name) AS player_name,
+      COUNT(*) AS games,
+      AVG(min) AS avg_min,
+      AVG(z_score) AS avg_z_score,
+      SUM(z_score) AS total_z_score,
+      AVG(pts) AS pts, AVG(reb) AS reb, AVG(ast) AS ast, AVG(stl) AS stl, AVG(blk) AS blk,
+      AVG(fg3m) AS fg3m, AVG(fg_pct) AS fg_pct, AVG(ft_pct) AS ft_pct, AVG(turnovers) AS turnovers
+    FROM `{PROJECT_ID}.{DATASET}.{TABLE}`
+    WHERE game_date BETWEEN @start AND @end
+      AND min > 0
+    GROUP BY player_id
+    HAVING COUNT(*) >= @min_games
+       AND AVG(min) >= @min_minutes
+    ORDER BY avg_z_score {order}
+    LIMIT @limit
     """
-    job_config = bigquery.QueryJobConfig(query_parameters=params)
-    df = client.query(query, job_config=job_config).to_dataframe()
+
+    params = [
+        bigquery.ScalarQueryParameter("start", "DATE", start_date),
+        bigquery.ScalarQueryParameter("end", "DATE", end_date),
+        bigquery.ScalarQueryParameter("min_games", "INT64", min_games),
+        bigquery.ScalarQueryParameter("min_minutes", "FLOAT64", min_minutes),
+        bigquery.ScalarQueryParameter("limit", "INT64", limit),
+    ]
+    df = run_query(client, query, params, endpoint="range_leaders",
+                   expected_partitions=_days(start_date, end_date), tables={DAILY_FQN: LEADER_COLS}).to_dataframe()
     return safe_records(df)
+
+def query_season_games(start_date, end_date):
+    """
+    Per-game rows in [start_date, end_date] with FGA/FTA joined from the historical table,
+    i.e. the season_games input of create_league_pg_stats_by_season.sql.
+    """
+    client = get_client()
+    query = f"""
+    SELECT
+      d.player_id, d.player_name, d.game_id, d.game_date,
+      d.min, d.pts, d.reb, d.ast, d.stl, d.blk, d.fg3m, d.fg_pct, d.ft_pct, d.turnovers,
+      d.z_score,
+      CAST(h.fg_attempts AS FLOAT64) AS fga, CAST(h.ft_attempts AS FLOAT64) AS fta
+    FROM `{DAILY_FQN}` d
+    LEFT JOIN (
+      SELECT player_id, game_date, fg_attempts, ft_attempts
+      FROM `{HIST_FQN}`
+      WHERE game_date BETWEEN @start AND @end  -- prune the historical table to the same dates
+    ) h USING (player_id, game_date)
+    WHERE d.game_date BETWEEN @start AND @end
+    """
+    params = [
+        bigquery.ScalarQueryParameter("start", "DATE", start_date),
+        bigquery.ScalarQueryParameter("end", "DATE", end_date),
+    ]
+    return run_query(client, query, params, endpoint="season_games",
+                     expected_partitions=_days(start_date, end_date),
+                     tables={DAILY_FQN: LEADER_COLS, HIST_FQN: HIST_USAGE_COLS}).to_dataframe()
+
+def get_season_games(season, start_date=None, end_date=None):
+    """
+    Per-game rows for a season, optionally narrowed to a date range inside it.
+    Served from the season store when it holds that season.
+    """
+    from .season_store import season_bounds
+
+    s_start, s_end = season_bounds(season)
+    start_date = max(start_date, s_start) if start_date else s_start
+    end_date = min(end_date, s_end) if end_date else s_end
+
+    store = _season_store()
+    if store is not None and store.season == season:
+        df = store.data.to_frame()
+        return df[(df["game_date"] >= start_date) & (df["game_date"] <= end_date)].reset_index(drop=True)
+    return query_season_games(start_date, end_date)
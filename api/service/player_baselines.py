@@ -1,4 +1,15 @@
 from google.cloud import bigquery
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from .bq_exec import run_query
+from .data_version import season_version
+from .season_store import get_store, on_refresh, season_bounds
+from .zscore import (BASELINE_CATS, CATEGORY_LABELS, per_player_averages, baseline_zscores,
+                     usage_percentiles, z_totals)
 
 PROJECT = "fantasy-survivor-app"
 LOC = "northamerica-northeast1"
@@ -6,179 +17,177 @@ TABLE_DAILY = "fantasy-survivor-app.nba_data.player_daily_game_stats_p"
 TABLE_HIST  = "fantasy-survivor-app.nba_data.player_historical_game_stats_p"
 TABLE_PRE   = "fantasy-survivor-app.nba_data.league_pg_stats_by_season"
 
-def get_player_baselines_v1(player_id: int, season: str, window: int = 5):
+LEAGUE_TTL_SECONDS = int(os.getenv("LEAGUE_BASELINE_TTL_SECONDS", "3600"))
+
+AVG_COLS = BASELINE_CATS + ["fga", "fta", "minutes", "usage_per_min"]
+
+# ----------------------------
+# league_pg_stats_by_season cache
+# ----------------------------
+_league: dict = {}  # season -> (row dict, fetched_at, data version)
+_league_lock = threading.Lock()
+
+@on_refresh
+def _invalidate_league(store):
+    # ingest rebuilds league_pg_stats_by_season for the current season
+    _league.pop(store.season, None)
+
+def get_league_baseline(season: str):
+    """
+    League means, stds and usage_q101 for a season, kept in memory until ingest
+    stamps a new data version for the season (or the TTL runs out).
+    """
+    version = season_version(season)  # read first so a concurrent stamp isn't missed
+    with _league_lock:
+        hit = _league.get(season)
+        if hit is not None and hit[2] == version and time.time() - hit[1] < LEAGUE_TTL_SECONDS:
+            return hit[0]
+
     client = bigquery.Client(project=PROJECT)
+    job = run_query(
+        client,
+        f"SELECT season, means, stds, usage_q101 FROM `{TABLE_PRE}` WHERE season = @season LIMIT 1",
+        [bigquery.ScalarQueryParameter("season", "STRING", season)],
+        endpoint="league_baseline",
+        location=LOC,
+    )
+    rows = list(job.result())
+    row = None
+    if rows:
+        r = rows[0]
+        row = {
+            "season": r["season"],
+            "means": dict(r["means"]),
+            "stds": dict(r["stds"]),
+            "usage_q101": list(r["usage_q101"] or []),
+        }
+    with _league_lock:
+        _league[season] = (row, time.time(), version)
+    return row
+
+# ----------------------------
+# player averages
+# ----------------------------
+def _averages_from_store(store, player_id: int, window: int):
+    games = store.player_games(player_id)
+    games = games[games["min"] > 0]
+    if games.empty:
+        return None, None
+    pg = per_player_averages(games)
+    l5 = per_player_averages(games.tail(window))
+    return games["player_name"].iloc[-1], pd.concat([pg, l5], ignore_index=True)[AVG_COLS]
+
+def _averages_from_bq(player_id: int, season: str, window: int):
+    client = bigquery.Client(project=PROJECT)
+    s_start, s_end = season_bounds(season)
 
     sql = f"""
-    DECLARE season STRING DEFAULT @season;
-    DECLARE y1 INT64 DEFAULT CAST(SPLIT(season, '-')[OFFSET(0)] AS INT64);
-    DECLARE s_start DATE DEFAULT DATE(y1, 10, 1);
-    DECLARE s_end   DATE DEFAULT DATE(y1 + 1, 6, 30);
-    DECLARE w INT64 DEFAULT @window;
-
-    WITH pre AS (
-      SELECT * FROM `{TABLE_PRE}` WHERE season = @season
-    ),
-    season_games AS (
+    WITH season_games AS (
       SELECT
         d.player_id, d.player_name, d.game_date, d.min as minutes,
         d.pts, d.reb, d.ast, d.stl, d.blk, d.fg3m, d.fg_pct, d.ft_pct, d.turnovers,
         h.fg_attempts AS fga, h.ft_attempts AS fta
       FROM `{TABLE_DAILY}` d
-      LEFT JOIN `{TABLE_HIST}` h USING (player_id, game_date)
+      LEFT JOIN (
+        SELECT player_id, game_date, fg_attempts, ft_attempts
+        FROM `{TABLE_HIST}`
+        WHERE player_id = @pid AND game_date BETWEEN @s_start AND @s_end
+      ) h USING (player_id, game_date)
       WHERE d.player_id = @pid
-        AND d.season = @season          -- fast equality on cluster + prunes by date below
-        AND d.game_date BETWEEN s_start AND s_end
+        AND d.game_date BETWEEN @s_start AND @s_end
         AND d.min > 0
     ),
-    per_player_pg AS (
-      SELECT
-        ANY_VALUE(player_id) AS player_id,
-        ANY_VALUE(player_name) AS player_name,
-        AVG(pts)  AS pts,  AVG(reb) AS reb, AVG(ast) AS ast, AVG(stl) AS stl, AVG(blk) AS blk,
-        AVG(fg3m) AS fg3m, AVG(fg_pct) AS fg_pct, AVG(ft_pct) AS ft_pct, AVG(turnovers) AS turnovers,
-        AVG(COALESCE(fga,0)) AS fga, AVG(COALESCE(fta,0)) AS fta,
-        AVG(minutes) AS minutes,
-        SAFE_DIVIDE(AVG(COALESCE(fga,0)) + AVG(COALESCE(fta,0)), NULLIF(AVG(minutes),0)) AS usage_per_min,
-        COUNT(*) AS gp
-      FROM season_games
-    ),
     lastN AS (
-      SELECT * EXCEPT(rn) FROM (
-        SELECT sg.*, ROW_NUMBER() OVER (ORDER BY game_date DESC) rn
-        FROM season_games sg
-      )
-      WHERE rn <= w
-    ),
-    per_player_l5 AS (
-      SELECT
-        AVG(pts)  AS pts,  AVG(reb) AS reb, AVG(ast) AS ast, AVG(stl) AS stl, AVG(blk) AS blk,
-        AVG(fg3m) AS fg3m, AVG(fg_pct) AS fg_pct, AVG(ft_pct) AS ft_pct, AVG(turnovers) AS turnovers,
-        AVG(COALESCE(fga,0)) AS fga, AVG(COALESCE(fta,0)) AS fta,
-        AVG(minutes) AS minutes,
-        SAFE_DIVIDE(AVG(COALESCE(fga,0)) + AVG(COALESCE(fta,0)), NULLIF(AVG(minutes),0)) AS usage_per_min
-      FROM lastN
-    ),
-    usage_percentiles AS (
-      SELECT
-        CAST(ARRAY_LENGTH( (SELECT ARRAY(SELECT v FROM UNNEST(pre.usage_q101) v WHERE v IS NOT NULL AND v <= pg.usage_per_min)) ) - 1 AS INT64) AS usage_proxy,
-        CAST(ARRAY_LENGTH( (SELECT ARRAY(SELECT v FROM UNNEST(pre.usage_q101) v WHERE v IS NOT NULL AND v <= l5.usage_per_min)) ) - 1 AS INT64) AS usage_proxy_l5
-      FROM per_player_pg pg, per_player_l5 l5, pre
+      SELECT * FROM season_games
+      WHERE TRUE
+      QUALIFY ROW_NUMBER() OVER (ORDER BY game_date DESC) <= @window
     )
     SELECT
-      pg.player_id, pg.player_name AS name,
-      pg.minutes AS minutes_season, l5.minutes AS minutes_l5,
-      NULLIF(up.usage_proxy,   -1) AS usage_proxy,
-      NULLIF(up.usage_proxy_l5,-1) AS usage_proxy_l5,
-
-      STRUCT(pg.pts AS avg_season,
-             SAFE_DIVIDE(pg.pts - pre.means.m_pts, NULLIF(pre.stds.s_pts,0)) AS z_season,
-             l5.pts AS avg_l5,
-             SAFE_DIVIDE(l5.pts - pre.means.m_pts, NULLIF(pre.stds.s_pts,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.pts - pre.means.m_pts, NULLIF(pre.stds.s_pts,0)) - SAFE_DIVIDE(pg.pts - pre.means.m_pts, NULLIF(pre.stds.s_pts,0))) AS z_delta) AS PTS,
-
-      STRUCT(pg.reb AS avg_season,
-             SAFE_DIVIDE(pg.reb - pre.means.m_reb, NULLIF(pre.stds.s_reb,0)) AS z_season,
-             l5.reb AS avg_l5,
-             SAFE_DIVIDE(l5.reb - pre.means.m_reb, NULLIF(pre.stds.s_reb,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.reb - pre.means.m_reb, NULLIF(pre.stds.s_reb,0)) - SAFE_DIVIDE(pg.reb - pre.means.m_reb, NULLIF(pre.stds.s_reb,0))) AS z_delta) AS REB,
-
-      STRUCT(pg.ast AS avg_season,
-             SAFE_DIVIDE(pg.ast - pre.means.m_ast, NULLIF(pre.stds.s_ast,0)) AS z_season,
-             l5.ast AS avg_l5,
-             SAFE_DIVIDE(l5.ast - pre.means.m_ast, NULLIF(pre.stds.s_ast,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.ast - pre.means.m_ast, NULLIF(pre.stds.s_ast,0)) - SAFE_DIVIDE(pg.ast - pre.means.m_ast, NULLIF(pre.stds.s_ast,0))) AS z_delta) AS AST,
-
-      STRUCT(pg.stl AS avg_season,
-             SAFE_DIVIDE(pg.stl - pre.means.m_stl, NULLIF(pre.stds.s_stl,0)) AS z_season,
-             l5.stl AS avg_l5,
-             SAFE_DIVIDE(l5.stl - pre.means.m_stl, NULLIF(pre.stds.s_stl,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.stl - pre.means.m_stl, NULLIF(pre.stds.s_stl,0)) - SAFE_DIVIDE(pg.stl - pre.means.m_stl, NULLIF(pre.stds.s_stl,0))) AS z_delta) AS STL,
-
-      STRUCT(pg.blk AS avg_season,
-             SAFE_DIVIDE(pg.blk - pre.means.m_blk, NULLIF(pre.stds.s_blk,0)) AS z_season,
-             l5.blk AS avg_l5,
-             SAFE_DIVIDE(l5.blk - pre.means.m_blk, NULLIF(pre.stds.s_blk,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.blk - pre.means.m_blk, NULLIF(pre.stds.s_blk,0)) - SAFE_DIVIDE(pg.blk - pre.means.m_blk, NULLIF(pre.stds.s_blk,0))) AS z_delta) AS BLK,
-
-      STRUCT(pg.fg3m AS avg_season,
-             SAFE_DIVIDE(pg.fg3m - pre.means.m_fg3m, NULLIF(pre.stds.s_fg3m,0)) AS z_season,
-             l5.fg3m AS avg_l5,
-             SAFE_DIVIDE(l5.fg3m - pre.means.m_fg3m, NULLIF(pre.stds.s_fg3m,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.fg3m - pre.means.m_fg3m, NULLIF(pre.stds.s_fg3m,0)) - SAFE_DIVIDE(pg.fg3m - pre.means.m_fg3m, NULLIF(pre.stds.s_fg3m,0))) AS z_delta) AS `3PM`,
-
-      STRUCT(pg.fg_pct AS avg_season,
-             SAFE_DIVIDE((pg.fg_pct - pre.means.m_fg_pct) * pg.fga, NULLIF(pre.stds.s_fg_imp,0)) AS z_season,
-             l5.fg_pct AS avg_l5,
-             SAFE_DIVIDE((l5.fg_pct - pre.means.m_fg_pct) * l5.fga, NULLIF(pre.stds.s_fg_imp,0)) AS z_l5,
-             (SAFE_DIVIDE((l5.fg_pct - pre.means.m_fg_pct) * l5.fga, NULLIF(pre.stds.s_fg_imp,0))
-            -  SAFE_DIVIDE((pg.fg_pct - pre.means.m_fg_pct) * pg.fga, NULLIF(pre.stds.s_fg_imp,0))) AS z_delta) AS `FG%`,
-
-      STRUCT(pg.ft_pct AS avg_season,
-             SAFE_DIVIDE((pg.ft_pct - pre.means.m_ft_pct) * pg.fta, NULLIF(pre.stds.s_ft_imp,0)) AS z_season,
-             l5.ft_pct AS avg_l5,
-             SAFE_DIVIDE((l5.ft_pct - pre.means.m_ft_pct) * l5.fta, NULLIF(pre.stds.s_ft_imp,0)) AS z_l5,
-             (SAFE_DIVIDE((l5.ft_pct - pre.means.m_ft_pct) * l5.fta, NULLIF(pre.stds.s_ft_imp,0))
-            -  SAFE_DIVIDE((pg.ft_pct - pre.means.m_ft_pct) * pg.fta, NULLIF(pre.stds.s_ft_imp,0))) AS z_delta) AS `FT%`,
-
-      STRUCT(pg.turnovers AS avg_season,
-             SAFE_DIVIDE(pg.turnovers - pre.means.m_tov, NULLIF(pre.stds.s_tov,0)) AS z_season,
-             l5.turnovers AS avg_l5,
-             SAFE_DIVIDE(l5.turnovers - pre.means.m_tov, NULLIF(pre.stds.s_tov,0)) AS z_l5,
-             (SAFE_DIVIDE(l5.turnovers - pre.means.m_tov, NULLIF(pre.stds.s_tov,0)) - SAFE_DIVIDE(pg.turnovers - pre.means.m_tov, NULLIF(pre.stds.s_tov,0))) AS z_delta) AS turnovers
-        FROM per_player_pg AS pg
-        JOIN per_player_l5 AS l5 ON TRUE
-        JOIN pre              ON TRUE
-        JOIN usage_percentiles AS up ON TRUE;
+      'season' AS span, ANY_VALUE(player_name) AS player_name, COUNT(*) AS gp,
+      AVG(pts)  AS pts,  AVG(reb) AS reb, AVG(ast) AS ast, AVG(stl) AS stl, AVG(blk) AS blk,
+      AVG(fg3m) AS fg3m, AVG(fg_pct) AS fg_pct, AVG(ft_pct) AS ft_pct, AVG(turnovers) AS turnovers,
+      AVG(COALESCE(fga,0)) AS fga, AVG(COALESCE(fta,0)) AS fta,
+      AVG(minutes) AS minutes,
+      SAFE_DIVIDE(AVG(COALESCE(fga,0)) + AVG(COALESCE(fta,0)), NULLIF(AVG(minutes),0)) AS usage_per_min
+    FROM season_games
+    UNION ALL
+    SELECT
+      'l5' AS span, ANY_VALUE(player_name) AS player_name, COUNT(*) AS gp,
+      AVG(pts)  AS pts,  AVG(reb) AS reb, AVG(ast) AS ast, AVG(stl) AS stl, AVG(blk) AS blk,
+      AVG(fg3m) AS fg3m, AVG(fg_pct) AS fg_pct, AVG(ft_pct) AS ft_pct, AVG(turnovers) AS turnovers,
+      AVG(COALESCE(fga,0)) AS fga, AVG(COALESCE(fta,0)) AS fta,
+      AVG(minutes) AS minutes,
+      SAFE_DIVIDE(AVG(COALESCE(fga,0)) + AVG(COALESCE(fta,0)), NULLIF(AVG(minutes),0)) AS usage_per_min
+    FROM lastN
     """
 
-    job = client.query(
+    job = run_query(
+        client,
         sql,
-        job_config=bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("pid", "INT64", player_id),
-                bigquery.ScalarQueryParameter("season", "STRING", season),
-                bigquery.ScalarQueryParameter("window", "INT64", window),
-            ]
-        ),
+        [
+            bigquery.ScalarQueryParameter("pid", "INT64", player_id),
+            bigquery.ScalarQueryParameter("s_start", "DATE", s_start),
+            bigquery.ScalarQueryParameter("s_end", "DATE", s_end),
+            bigquery.ScalarQueryParameter("window", "INT64", window),
+        ],
+        endpoint="player_baselines",
         location=LOC,
+        expected_partitions=(s_end - s_start).days + 1,
+        tables={
+            TABLE_DAILY: ["player_id", "player_name", "game_date", "min", "pts", "reb", "ast",
+                          "stl", "blk", "fg3m", "fg_pct", "ft_pct", "turnovers"],
+            TABLE_HIST: ["player_id", "game_date", "fg_attempts", "ft_attempts"],
+        },
     )
-    rows = list(job.result())
-    if not rows:
+    df = job.to_dataframe().set_index("span")
+    if df.empty or not df.loc["season", "gp"]:
+        return None, None
+    return df.loc["season", "player_name"], df.loc[["season", "l5"], AVG_COLS].reset_index(drop=True)
+
+# ----------------------------
+# baselines
+# ----------------------------
+def get_player_baselines_v1(player_id: int, season: str, window: int = 5):
+    # refresh the store before reading the league row, so both come from the same ingest
+    store = get_store()
+    league = get_league_baseline(season)
+    if league is None:
         return None
-    r = rows[0]
-
-    # totals
-    def z(obj, k): return float(obj[k]) if obj[k] is not None else 0.0
-    z_total_season = (
-        z(r["PTS"], "z_season") + z(r["REB"], "z_season") + z(r["AST"], "z_season") +
-        z(r["STL"], "z_season") + z(r["BLK"], "z_season") + z(r["3PM"], "z_season") +
-        z(r["FG%"], "z_season") + z(r["FT%"], "z_season") - z(r["turnovers"], "z_season")
-    )
-    z_total_l5 = (
-        z(r["PTS"], "z_l5") + z(r["REB"], "z_l5") + z(r["AST"], "z_l5") +
-        z(r["STL"], "z_l5") + z(r["BLK"], "z_l5") + z(r["3PM"], "z_l5") +
-        z(r["FG%"], "z_l5") + z(r["FT%"], "z_l5") - z(r["turnovers"], "z_l5")
-    )
 
-    return {
-        "player_id": r["player_id"],
-        "name": r["name"],
+    if store is not None and store.season == season:
+        name, avgs = _averages_from_store(store, player_id, window)
+    else:
+        name, avgs = _averages_from_bq(player_id, season, window)
+    if avgs is None:
+        return None
+
+    # row 0 = season, row 1 = last-N
+    z = baseline_zscores(avgs, league)
+    totals = z_totals(z)
+    usage = usage_percentiles(avgs["usage_per_min"], league["usage_q101"])
+    avg = avgs[BASELINE_CATS].to_numpy(dtype=float)
+
+    def _v(x):
+        return None if x is None or np.isnan(x) else float(x)
+
+    out = {
+        "player_id": int(player_id),
+        "name": name,
         "position": None,
-        "minutes_season": r["minutes_season"],
-        "minutes_l5": r["minutes_l5"],
-        "usage_proxy": r["usage_proxy"],
-        "usage_proxy_l5": r["usage_proxy_l5"],
-        "PTS": dict(r["PTS"]),
-        "REB": dict(r["REB"]),
-        "AST": dict(r["AST"]),
-        "STL": dict(r["STL"]),
-        "BLK": dict(r["BLK"]),
-        "3PM": dict(r["3PM"]),
-        "FG%": dict(r["FG%"]),
-        "FT%": dict(r["FT%"]),
-        "turnovers":  dict(r["turnovers"]),
-        "z_total_season": round(z_total_season, 3),
-        "z_total_l5": round(z_total_l5, 3),
-        "z_total_delta": round(z_total_l5 - z_total_season, 3),
+        "minutes_season": _v(avgs["minutes"].iloc[0]),
+        "minutes_l5": _v(avgs["minutes"].iloc[1]),
+        "usage_proxy": None if np.isnan(usage[0]) else int(usage[0]),
+        "usage_proxy_l5": None if np.isnan(usage[1]) else int(usage[1]),
     }
+    for i, key in enumerate(CATEGORY_LABELS):
+        out[key] = {
+            "avg_season": _v(avg[0, i]),
+            "z_season": _v(z[0, i]),
+            "avg_l5": _v(avg[1, i]),
+            "z_l5": _v(z[1, i]),
+            "z_delta": _v(z[1, i] - z[0, i]),
+        }
+    out["z_total_season"] = round(float(totals[0]), 3)
+    out["z_total_l5"] = round(float(totals[1]), 3)
+    out["z_total_delta"] = round(float(totals[1]) - float(totals[0]), 3)
+    return out
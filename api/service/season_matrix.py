@@ -0,0 +1,85 @@
+# service/season_matrix.py
+"""
+Players x categories z matrix per season, cached in process per season data
+version, so a body built after an ingest never comes from the pre-ingest matrix.
+
+Per-player season averages are computed like get_player_baselines_v1's, but the
+league baseline is recomputed from those averages (league_baseline_from_averages,
+mirroring create_league_pg_stats_by_season.sql) rather than read from
+league_pg_stats_by_season. So it covers any season, and z values can differ
+slightly from /v1/player_baselines between league table rebuilds.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .data_version import season_version
+from .nba_fetch import get_season_games
+from .season_store import get_store, on_refresh
+from .zscore import (BASELINE_CATS, CAT_SIGN, CATEGORY_LABELS, per_player_averages,
+                     league_baseline_from_averages, baseline_zscores)
+
+MATRIX_TTL_SECONDS = int(os.getenv("SEASON_MATRIX_TTL_SECONDS", "3600"))
+
+
+class SeasonMatrix:
+    def __init__(self, season: str, games: pd.DataFrame, data_version: Optional[str] = None):
+        pp = per_player_averages(games)
+        names = games.drop_duplicates("player_id", keep="last").set_index("player_id")["player_name"]
+
+        self.season = season
+        self.data_version = data_version
+        self.baseline = league_baseline_from_averages(pp, season)
+        self.player_ids = pp.index.to_numpy(dtype=np.int64)
+        self.names = names.reindex(pp.index).to_numpy(dtype=object)
+        self.gp = pp["gp"].to_numpy(dtype=np.int64)
+        self.minutes = pp["minutes"].to_numpy(dtype=float)
+        self.avg = pp[BASELINE_CATS].to_numpy(dtype=float)
+        self.z = baseline_zscores(pp, self.baseline)
+        # signed so every column reads "higher is better"; missing z counts as league average
+        self.features = np.nan_to_num(self.z) * CAT_SIGN
+        self.sq_norms = np.einsum("ij,ij->i", self.features, self.features)
+        self.norms = np.sqrt(self.sq_norms)
+        self.row: Dict[int, int] = {int(p): i for i, p in enumerate(self.player_ids)}
+        self.built_at = time.time()
+
+    def rows(self, player_ids) -> tuple[np.ndarray, List[int]]:
+        """Row positions for the ids present in the matrix, plus the ids that are not."""
+        idx, missing = [], []
+        for pid in player_ids:
+            i = self.row.get(int(pid))
+            if i is None:
+                missing.append(int(pid))
+            else:
+                idx.append(i)
+        return np.asarray(idx, dtype=np.int64), missing
+
+
+_cache: Dict[str, SeasonMatrix] = {}
+_lock = threading.Lock()
+
+@on_refresh
+def _invalidate_current(store):
+    _cache.pop(store.season, None)
+
+def get_season_matrix(season: str) -> Optional[SeasonMatrix]:
+    version = season_version(season)  # read first so a concurrent stamp isn't missed
+    with _lock:
+        m = _cache.get(season)
+        if (m is not None and m.data_version == version
+                and time.time() - m.built_at < MATRIX_TTL_SECONDS):
+            return m
+    games = get_season_games(season)
+    if games.empty:
+        return None
+    m = SeasonMatrix(season, games, version)
+    store = get_store()
+    if store is not None and store.season == season and store.data_version != version:
+        return m  # store hasn't caught up with this version yet (refresh in progress); don't pin it
+    with _lock:
+        _cache[season] = m
+    return m
@@ -0,0 +1,304 @@
+# service/season_store.py
+"""
+Optional in-process column store for the current season's player_daily_game_stats_p rows.
+
+Enable with SEASON_STORE=1. The season is loaded once into NumPy arrays sorted by
+(player_id, game_date), with a per-player offset index and a per-date row index.
+It refreshes incrementally (only partitions from the last loaded date onward) whenever
+ingest stamps a new data version, and at least every SEASON_STORE_REFRESH_SECONDS.
+If an earlier date was re-stamped (re-ingest, backfill), the season is reloaded.
+Anything outside the current season still goes to BigQuery.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .data_version import season_version, season_versions
+from .nba_fetch import query_season_games, safe_records
+
+SEASON_STORE_ENABLED = os.getenv("SEASON_STORE", "0") == "1"
+# Shared mmap snapshot directory (see service/snapshot.py); unset = per-process arrays
+SNAPSHOT_DIR = os.getenv("SEASON_SNAPSHOT_DIR")
+REFRESH_SECONDS = int(os.getenv("SEASON_STORE_REFRESH_SECONDS", "300"))
+
+NUM_COLS = ["min", "pts", "reb", "ast", "stl", "blk", "fg3m", "fg_pct", "ft_pct", "turnovers",
+            "z_score", "fga", "fta"]
+
+def current_season(today: Optional[date] = None) -> str:
+    d = today or date.today()
+    y = d.year if d.month >= 10 else d.year - 1
+    return f"{y}-{(y + 1) % 100:02d}"
+
+def season_bounds(season: str) -> Tuple[date, date]:
+    y1 = int(season.split("-")[0])
+    return date(y1, 10, 1), date(y1 + 1, 6, 30)
+
+def _as_date(d) -> date:
+    return d.date() if isinstance(d, datetime) else d
+
+
+class SeasonColumns:
+    """
+    Immutable column arrays for one season plus their indexes. Rows are sorted by
+    (player_id, game_date) so each player's games are one contiguous slice.
+    """
+    def __init__(self, player_id, game_id, game_date, name_code, names, cols, date_order=None):
+        self.player_id = player_id
+        self.game_id = game_id
+        self.game_date = game_date
+        self.name_code = name_code
+        self.names = names
+        self.cols = cols
+        self.date_order = np.argsort(game_date, kind="mergesort") if date_order is None else date_order
+        self._index()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SeasonColumns":
+        df = df.copy()
+        df["game_date"] = pd.to_datetime(df["game_date"]).astype("datetime64[s]")
+        df = df.sort_values(["player_id", "game_date"], kind="mergesort").reset_index(drop=True)
+
+        codes, names = pd.factorize(df["player_name"])
+        return cls(
+            player_id=df["player_id"].to_numpy(dtype=np.int64),
+            game_id=df["game_id"].to_numpy(dtype=np.int64),
+            game_date=df["game_date"].to_numpy().astype("datetime64[D]"),
+            name_code=codes.astype(np.int32),
+            # trailing None so code -1 (missing name) maps to None
+            names=np.append(np.asarray(names, dtype=object), None),
+            cols={c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) for c in NUM_COLS},
+        )
+
+    def _index(self):
+        # per-player offsets: rows are contiguous per player_id
+        pids, starts, counts = np.unique(self.player_id, return_index=True, return_counts=True)
+        self.player_offsets: Dict[int, Tuple[int, int]] = {
+            int(p): (int(s), int(s + c)) for p, s, c in zip(pids, starts, counts)
+        }
+
+        # per-date index: row positions (views into date_order) for each game_date
+        order = self.date_order
+        days, dstarts = np.unique(self.game_date[order], return_index=True)
+        bounds = np.append(dstarts, len(order))
+        self.date_rows: Dict[np.datetime64, np.ndarray] = {
+            d: order[bounds[i]:bounds[i + 1]] for i, d in enumerate(days)
+        }
+        self.max_date: Optional[date] = days[-1].astype(object) if len(days) else None
+
+    def __len__(self):
+        return len(self.player_id)
+
+    def to_frame(self, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        idx = slice(None) if rows is None else rows
+        df = pd.DataFrame({
+            "player_id": self.player_id[idx],
+            "player_name": self.names[self.name_code[idx]],
+            "game_id": self.game_id[idx],
+            "game_date": self.game_date[idx],
+        })
+        for c in NUM_COLS:
+            df[c] = self.cols[c][idx]
+        df["game_date"] = pd.to_datetime(df["game_date"]).dt.date
+        return df
+
+    def player_rows(self, player_id: int, start_date=None, end_date=None) -> np.ndarray:
+        lo, hi = self.player_offsets.get(int(player_id), (0, 0))
+        dates = self.game_date[lo:hi]
+        a = np.searchsorted(dates, np.datetime64(_as_date(start_date), "D"), "left") if start_date else 0
+        b = np.searchsorted(dates, np.datetime64(_as_date(end_date), "D"), "right") if end_date else hi - lo
+        return np.arange(lo + a, lo + b)
+
+
+_refresh_hooks = []
+
+def on_refresh(hook):
+    """
+    Register a callable(store) to run after every (re)load, e.g. to drop derived caches.
+    """
+    _refresh_hooks.append(hook)
+    return hook
+
+
+class SeasonStore:
+    def __init__(self, season: str):
+        self.season = season
+        self.start, self.end = season_bounds(season)
+        self.loaded_at = 0.0
+        self.snapshot_version: Optional[str] = None
+        self.data_version: Optional[str] = None  # ingest stamp the data was loaded at
+        self.date_versions: Optional[Dict[date, str]] = None  # per-date stamps behind data_version
+        self.data = SeasonColumns.from_frame(pd.DataFrame(columns=["player_id", "player_name", "game_id", "game_date"] + NUM_COLS))
+        self._refreshing = threading.Lock()
+
+    # ----------------------------
+    # loading
+    # ----------------------------
+    def _query(self, since: date) -> pd.DataFrame:
+        return query_season_games(since, self.end)
+
+    def _swap(self, data: SeasonColumns, data_version: Optional[str],
+              date_versions: Optional[Dict[date, str]] = None, loaded_at: Optional[float] = None):
+        # single attribute assignment, so readers holding the old SeasonColumns stay consistent
+        self.data = data
+        self.data_version = data_version
+        self.date_versions = date_versions
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        for hook in _refresh_hooks:
+            hook(self)
+
+    def load(self):
+        version, dates = season_versions(self.season)  # read first so a concurrent stamp isn't missed
+        self._swap(SeasonColumns.from_frame(self._query(self.start)), version, dates)
+
+    def refresh(self):
+        """
+        Re-read only partitions from the last loaded date onward and merge them in.
+        The last date is re-read because it may have been appended to since the previous load.
+        Falls back to a full load when a date before that was re-stamped.
+        """
+        data = self.data
+        if data.max_date is None:
+            return self.load()
+        since = data.max_date
+        version, dates = season_versions(self.season)
+        if dates is not None:
+            if self.date_versions is None:
+                return self.load()  # can't tell which dates changed
+            changed = [d for d, v in dates.items() if self.date_versions.get(d) != v]
+            if changed and min(changed) < since:
+                return self.load()
+        fresh = self._query(since)
+        keep = np.flatnonzero(data.game_date < np.datetime64(since, "D"))
+        self._swap(SeasonColumns.from_frame(pd.concat([data.to_frame(keep), fresh], ignore_index=True)),
+                   version, dates)
+
+    def load_snapshot(self, root) -> bool:
+        """
+        Map the current shared snapshot if it is for this season and newer than what we hold.
+        """
+        from .snapshot import current_version, read_snapshot
+
+        version = current_version(root)
+        if not version or not version.startswith(self.season + "-"):
+            return False
+        if version != self.snapshot_version:
+            meta, data = read_snapshot(root, version)
+            self.snapshot_version = version
+            dates = meta.get("date_versions")
+            if dates is not None:
+                dates = {date.fromisoformat(d): v for d, v in dates.items()}
+            self._swap(data, meta.get("data_version"), dates, loaded_at=meta["created_at"])
+        return True
+
+    def write_snapshot(self, root):
+        from .snapshot import write_snapshot
+
+        write_snapshot(root, self.season, self.data, self.data_version, self.date_versions)
+        self.load_snapshot(root)  # remap, so this worker shares the pages too
+
+    def maybe_refresh(self):
+        if SNAPSHOT_DIR:
+            self.load_snapshot(SNAPSHOT_DIR)  # pick up a snapshot written by another worker
+        if not self._due():
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return  # another request is already refreshing; serve the current data
+        try:
+            if SNAPSHOT_DIR:
+                self._refresh_snapshot()
+            else:
+                self.refresh()
+        finally:
+            self._refreshing.release()
+
+    def _due(self) -> bool:
+        """
+        Refresh when ingest has stamped a new data version, or after REFRESH_SECONDS.
+        """
+        if time.time() - self.loaded_at >= REFRESH_SECONDS:
+            return True
+        version = season_version(self.season)
+        return version is not None and version != self.data_version
+
+    def _refresh_snapshot(self):
+        from .snapshot import writer_lock
+
+        with writer_lock(SNAPSHOT_DIR, blocking=False) as acquired:
+            if not acquired:
+                return  # another worker is rebuilding the snapshot
+            self.load_snapshot(SNAPSHOT_DIR)
+            if not self._due():
+                return
+            self.refresh()
+            self.write_snapshot(SNAPSHOT_DIR)
+
+    # ----------------------------
+    # queries
+    # ----------------------------
+    def covers(self, *dates) -> bool:
+        return all(d is not None and self.start <= _as_date(d) <= self.end for d in dates)
+
+    def player_games(self, player_id, start_date=None, end_date=None) -> pd.DataFrame:
+        data = self.data
+        return data.to_frame(data.player_rows(player_id, start_date, end_date))
+
+    def daily_leaders(self, game_date, limit=10, mode="best") -> List[dict]:
+        data = self.data
+        rows = data.date_rows.get(np.datetime64(_as_date(game_date), "D"), np.empty(0, dtype=np.int64))
+        if mode == "worst":
+            rows = rows[data.cols["min"][rows] >= 20]
+        df = data.to_frame(rows)
+        best = mode == "best"
+        df = df.sort_values("z_score", ascending=not best, na_position="last" if best else "first",
+                            kind="mergesort").head(limit)
+        return safe_records(df[["player_id", "player_name", "game_id", "game_date", "min",
+                                "pts", "reb", "ast", "stl", "blk", "fg3m", "fg_pct", "ft_pct",
+                                "turnovers", "z_score"]])
+
+    def player_time_series(self, player_id, start_date=None, end_date=None) -> List[dict]:
+        df = self.player_games(player_id, start_date, end_date)
+        return safe_records(df[["game_date", "game_id", "pts", "reb", "ast", "stl", "blk", "fg3m",
+                                "fg_pct", "ft_pct", "turnovers", "z_score"]])
+
+
+_store: Optional[SeasonStore] = None
+_store_lock = threading.Lock()
+
+def get_store() -> Optional[SeasonStore]:
+    """
+    Return the loaded current-season store, or None when SEASON_STORE is off.
+    """
+    global _store
+    if not SEASON_STORE_ENABLED:
+        return None
+    with _store_lock:
+        season = current_season()
+        if _store is None or _store.season != season:
+            store = SeasonStore(season)
+            if SNAPSHOT_DIR:
+                _bootstrap_from_snapshot(store)
+            else:
+                store.load()
+            _store = store
+        store = _store
+    store.maybe_refresh()
+    return store
+
+def _bootstrap_from_snapshot(store: SeasonStore):
+    """
+    Map the shared snapshot, or build it once (first worker wins) and map that.
+    """
+    from .snapshot import writer_lock
+
+    if store.load_snapshot(SNAPSHOT_DIR):
+        return
+    with writer_lock(SNAPSHOT_DIR):
+        if store.load_snapshot(SNAPSHOT_DIR):
+            return
+        store.load()
+        store.write_snapshot(SNAPSHOT_DIR)
@@ -0,0 +1,82 @@
+# service/similarity.py
+"""
+Comparable-player search over the cached season z matrix.
+
+Row norms are precomputed per season, so a cosine or Euclidean k-NN query is one
+matrix-vector product plus a partial sort.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .season_matrix import get_season_matrix
+from .zscore import CATEGORY_LABELS
+
+METRICS = ("cosine", "euclidean")
+
+def similar_players(season: str,
+                    player_id: int,
+                    k: int = 10,
+                    metric: str = "cosine",
+                    min_games: int = 0,
+                    punt: Iterable[str] = ()) -> Optional[dict]:
+    """
+    Players whose 9-cat z profile is closest to player_id's.
+    punt: category labels to ignore (e.g. ["FT%"]); otherwise precomputed norms are used.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    punt = set(punt)
+    unknown = punt - set(CATEGORY_LABELS)
+    if unknown:
+        raise ValueError(f"Unknown punt categories {sorted(unknown)}; use {CATEGORY_LABELS}")
+    m = get_season_matrix(season)
+    if m is None:
+        return None
+    i = m.row.get(int(player_id))
+    if i is None:
+        return None
+
+    if punt:
+        keep = np.array([c not in punt for c in CATEGORY_LABELS], dtype=float)
+        X = m.features * keep
+        sq = np.einsum("ij,ij->i", X, X)
+        norms = np.sqrt(sq)
+    else:
+        X, sq, norms = m.features, m.sq_norms, m.norms
+
+    dots = X @ X[i]
+    if metric == "cosine":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = dots / (norms * norms[i])
+        rank_key = -np.nan_to_num(score, nan=-np.inf)
+    else:
+        score = np.sqrt(np.maximum(sq + sq[i] - 2.0 * dots, 0.0))
+        rank_key = score.copy()
+
+    rank_key[i] = np.inf
+    rank_key[m.gp < min_games] = np.inf
+    k = min(k, max(int(np.isfinite(rank_key).sum()), 0))
+    top = np.argpartition(rank_key, k)[:k] if k < len(rank_key) else np.arange(len(rank_key))
+    top = top[np.argsort(rank_key[top], kind="stable")][:k]
+
+    def _profile(j):
+        return {c: (None if np.isnan(v) else round(float(v), 3)) for c, v in zip(CATEGORY_LABELS, m.z[j])}
+
+    return {
+        "season": season,
+        "metric": metric,
+        "punt": sorted(punt),
+        "player": {"player_id": int(m.player_ids[i]), "name": m.names[i], "gp": int(m.gp[i]),
+                   "z": _profile(i)},
+        "matches": [
+            {
+                "player_id": int(m.player_ids[j]),
+                "name": m.names[j],
+                "gp": int(m.gp[j]),
+                ("similarity" if metric == "cosine" else "distance"): round(float(score[j]), 4),
+                "z": _profile(j),
+            }
+            for j in top
+        ],
+    }
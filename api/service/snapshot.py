@@ -0,0 +1,136 @@
+# service/snapshot.py
+"""
+On-disk season snapshot shared by all uvicorn workers.
+
+A snapshot is a directory of .npy column files (plus a names JSON) written once;
+every worker np.load()s the columns with mmap_mode="r", so the pages are shared
+through the OS page cache instead of copied into each process. The player search
+index (player_lookup) is out of scope: it is built from nba_api's bundled static
+list in each worker either way.
+
+Layout under SEASON_SNAPSHOT_DIR:
+  CURRENT                   -> name of the active version directory
+  <season>-<ns>/meta.json
+  <season>-<ns>/*.npy
+  <season>-<ns>/names.json
+
+Warm up (or run after ingest):
+  python -m service.snapshot --out /tmp/season_snapshot
+"""
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .season_store import NUM_COLS, SeasonColumns
+
+SNAPSHOT_DIR = os.getenv("SEASON_SNAPSHOT_DIR")
+KEEP_VERSIONS = 2
+ARRAYS = ["player_id", "game_id", "game_date", "name_code", "date_order"]
+
+def current_version(root) -> Optional[str]:
+    try:
+        return (Path(root) / "CURRENT").read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def writer_lock(root, blocking: bool = True):
+    """
+    Cross-process lock so only one worker builds a snapshot. Yields whether it was acquired.
+    """
+    Path(root).mkdir(parents=True, exist_ok=True)
+    with open(Path(root) / ".lock", "w") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def write_snapshot(root, season: str, data: SeasonColumns, data_version: Optional[str] = None,
+                   date_versions: Optional[dict] = None) -> str:
+    """
+    Write a new version and atomically point CURRENT at it. Returns the version name.
+    """
+    root = Path(root)
+    version = f"{season}-{time.time_ns()}"
+    tmp = root / f".{version}.tmp"
+    tmp.mkdir(parents=True)
+
+    for name in ARRAYS:
+        np.save(tmp / f"{name}.npy", np.ascontiguousarray(getattr(data, name)))
+    for c in NUM_COLS:
+        np.save(tmp / f"col_{c}.npy", np.ascontiguousarray(data.cols[c]))
+    (tmp / "names.json").write_text(json.dumps([str(n) for n in data.names[:-1]]))
+    (tmp / "meta.json").write_text(json.dumps({
+        "season": season,
+        "rows": len(data),
+        "max_date": str(data.max_date) if data.max_date else None,
+        "created_at": time.time(),
+        "data_version": data_version,
+        "date_versions": ({str(d): v for d, v in date_versions.items()}
+                          if date_versions is not None else None),
+    }))
+
+    os.rename(tmp, root / version)
+    pointer = root / ".CURRENT.tmp"
+    pointer.write_text(version)
+    os.replace(pointer, root / "CURRENT")
+    _prune(root, season, version)
+    return version
+
+def _prune(root: Path, season: str, keep: str):
+    # workers still mapping an older version keep their pages after unlink
+    versions = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != keep:
+            shutil.rmtree(root / name, ignore_errors=True)
+
+def read_snapshot(root, version: Optional[str] = None) -> Tuple[dict, SeasonColumns]:
+    """
+    Map a snapshot read-only. Column arrays are np.memmap views; nothing is copied.
+    """
+    path = Path(root) / (version or current_version(root))
+    meta = json.loads((path / "meta.json").read_text())
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in ARRAYS}
+    cols = {c: np.load(path / f"col_{c}.npy", mmap_mode="r") for c in NUM_COLS}
+    names = np.append(np.asarray(json.loads((path / "names.json").read_text()), dtype=object), None)
+    data = SeasonColumns(
+        player_id=arrays["player_id"],
+        game_id=arrays["game_id"],
+        game_date=arrays["game_date"],
+        name_code=arrays["name_code"],
+        names=names,
+        cols=cols,
+        date_order=arrays["date_order"],
+    )
+    return meta, data
+
+def main():
+    from .season_store import SeasonStore, current_season
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=SNAPSHOT_DIR or "/tmp/season_snapshot")
+    ap.add_argument("--season", default=None)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    store = SeasonStore(args.season or current_season())
+    store.load()
+    with writer_lock(args.out):
+        version = write_snapshot(args.out, store.season, store.data, store.data_version, store.date_versions)
+    print(f"Wrote {len(store.data)} rows to {Path(args.out) / version} in {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# service/team_eval.py
+"""
+Team-level 9-cat evaluation on top of the cached season z matrix.
+"""
+from itertools import combinations
+from math import comb
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .season_matrix import SeasonMatrix, get_season_matrix
+from .zscore import CAT_SIGN, CATEGORY_LABELS
+
+def _by_category(values: np.ndarray) -> Dict[str, float]:
+    return {label: round(float(v), 3) for label, v in zip(CATEGORY_LABELS, values)}
+
+def _team(m: SeasonMatrix, roster: Sequence[int]) -> dict:
+    idx, missing = m.rows(roster)
+    totals = np.nansum(m.z[idx], axis=0)
+    signed = totals * CAT_SIGN
+    z_total = float(signed.sum())
+    return {
+        "player_ids": [int(p) for p in m.player_ids[idx]],
+        "missing": missing,
+        "totals": _by_category(totals),
+        "z_total": round(z_total, 3),
+        # z_total with each category punted (left out)
+        "punt": _by_category(z_total - signed),
+        "_totals": totals,
+    }
+
+def evaluate_rosters(season: str, roster_a: Sequence[int], roster_b: Sequence[int]) -> Optional[dict]:
+    """
+    Compare two rosters (e.g. before/after a trade): category totals, deltas (b - a),
+    and punt views for each single category.
+    """
+    m = get_season_matrix(season)
+    if m is None:
+        return None
+
+    a, b = _team(m, roster_a), _team(m, roster_b)
+    delta = b.pop("_totals") - a.pop("_totals")
+    better = delta * CAT_SIGN  # > 0 means roster_b is better in that category
+
+    return {
+        "season": season,
+        "categories": CATEGORY_LABELS,
+        "roster_a": a,
+        "roster_b": b,
+        "delta": _by_category(delta),
+        "z_total_delta": round(b["z_total"] - a["z_total"], 3),
+        "punt_delta": {k: round(b["punt"][k] - a["punt"][k], 3) for k in CATEGORY_LABELS},
+        "categories_improved": [c for c, v in zip(CATEGORY_LABELS, better) if v > 0],
+        "categories_worse": [c for c, v in zip(CATEGORY_LABELS, better) if v < 0],
+    }
+
+def count_trade_candidates(n_roster: int, n_targets: int, max_give: int = 2, max_get: int = 2) -> int:
+    """len(trade_candidates(...)[0]) without enumerating them."""
+    gives = sum(comb(n_roster, n) for n in range(1, max_give + 1))
+    gets = sum(comb(n_targets, n) for n in range(1, max_get + 1))
+    return gives * gets
+
+def trade_candidates(roster: Sequence[int],
+                     targets: Sequence[int],
+                     max_give: int = 2,
+                     max_get: int = 2) -> Tuple[List[Tuple[int, ...]], List[Tuple[int, ...]]]:
+    """
+    Every trade sending 1..max_give players from roster for 1..max_get from targets,
+    as parallel gives/gets lists for scan_trades.
+    """
+    gives: List[Tuple[int, ...]] = []
+    gets: List[Tuple[int, ...]] = []
+    give_sets = [c for n in range(1, max_give + 1) for c in combinations(roster, n)]
+    get_sets = [c for n in range(1, max_get + 1) for c in combinations(targets, n)]
+    for give in give_sets:
+        for get in get_sets:
+            gives.append(give)
+            gets.append(get)
+    return gives, gets
+
+def scan_trades(season: str,
+                gives: List[Iterable[int]],
+                gets: List[Iterable[int]],
+                punt: Iterable[str] = (),
+                top: int = 20) -> Optional[List[dict]]:
+    """
+    Score many candidate trades at once. Candidate i sends gives[i] and receives gets[i];
+    its score is the signed z_total change over the non-punted categories.
+    One (candidates x involved players) @ (involved players x categories) product
+    covers the whole scan.
+    """
+    punt = set(punt)
+    unknown = punt - set(CATEGORY_LABELS)
+    if unknown:
+        raise ValueError(f"Unknown punt categories {sorted(unknown)}; use {CATEGORY_LABELS}")
+    m = get_season_matrix(season)
+    if m is None:
+        return None
+
+    # only players that appear in some candidate need a column
+    involved = sorted({int(p) for side in (gives, gets) for c in side for p in c if int(p) in m.row})
+    col = {p: j for j, p in enumerate(involved)}
+    signed = np.nan_to_num(m.z[[m.row[p] for p in involved]]) * CAT_SIGN
+    weights = np.array([0.0 if c in punt else 1.0 for c in CATEGORY_LABELS])
+
+    swap = np.zeros((len(gives), len(involved)))
+    for i, (give, get) in enumerate(zip(gives, gets)):
+        for p in give:
+            if int(p) in col:
+                swap[i, col[int(p)]] -= 1.0
+        for p in get:
+            if int(p) in col:
+                swap[i, col[int(p)]] += 1.0
+
+    delta = swap @ signed            # (candidates, 9), signed so higher is better
+    score = delta @ weights
+    order = np.argsort(-score, kind="stable")[:top]
+    return [
+        {
+            "give": [int(p) for p in gives[i]],
+            "get": [int(p) for p in gets[i]],
+            "score": round(float(score[i]), 3),
+            "delta": _by_category(delta[i] * CAT_SIGN),
+        }
+        for i in order
+    ]
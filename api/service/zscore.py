@@ -1,5 +1,6 @@
 # service/zscore.py
 from typing import List, Dict, Optional
+from datetime import date
 import numpy as np
 import pandas as pd
 
@@ -84,9 +85,125 @@ def compute_baseline_from_frame(box_df: pd.DataFrame) -> Dict[str, List[float]]:
     Compute mean/stdev vectors from a frame of player games (e.g., across a range).
     Useful if you want a 2024-25 baseline instead of 2021-22.
     Returned dict has 'mean' and 'stdev' arrays in NINE_CAT_ORDER.
+    Note: these are per-game stats; compute_league_baseline() reproduces the
+    per-player-average baseline stored in league_pg_stats_by_season.
     """
     nine = nine_cat_frame(box_df)
     stats = nine[NINE_CAT_ORDER].astype(float)
     means = [float(stats[c].mean()) for c in NINE_CAT_ORDER]
     stdevs = [float(stats[c].std(ddof=1) or 1.0) for c in NINE_CAT_ORDER]
     return {"mean": means, "stdev": stdevs}
+
+# --- League baseline (mirrors infra/bq/sql/create_league_pg_stats_by_season.sql) --
+# Categories as named in player_daily_game_stats_p, with the means/stds keys used
+# in league_pg_stats_by_season.
+BASELINE_CATS = ["pts", "reb", "ast", "stl", "blk", "fg3m", "fg_pct", "ft_pct", "turnovers"]
+MEAN_KEYS = ["m_pts", "m_reb", "m_ast", "m_stl", "m_blk", "m_fg3m", "m_fg_pct", "m_ft_pct", "m_tov"]
+STD_KEYS = ["s_pts", "s_reb", "s_ast", "s_stl", "s_blk", "s_fg3m", "s_fg_pct", "s_ft_pct", "s_tov"]
+# Category labels in API responses, in BASELINE_CATS order
+CATEGORY_LABELS = ["PTS", "REB", "AST", "STL", "BLK", "3PM", "FG%", "FT%", "turnovers"]
+
+# APPROX_QUANTILES(x, 101) returns 102 boundaries (min .. max)
+USAGE_QUANTILES = 101
+
+def per_player_averages(games: pd.DataFrame,
+                        start: Optional[date] = None,
+                        end: Optional[date] = None) -> pd.DataFrame:
+    """
+    Per-player averages over games with minutes > 0 (the per_player_pg CTE).
+    games: one row per player-game with player_id, game_date, min (or minutes),
+    the 9 categories in BASELINE_CATS, fga and fta.
+    """
+    g = games.rename(columns={"min": "minutes"})
+    if start is not None:
+        g = g[g["game_date"] >= start]
+    if end is not None:
+        g = g[g["game_date"] <= end]
+    g = g[g["minutes"] > 0]
+
+    cols = BASELINE_CATS + ["fga", "fta", "minutes"]
+    g = g[["player_id"] + cols].astype({c: float for c in cols})
+    g = g.assign(fga=g["fga"].fillna(0.0), fta=g["fta"].fillna(0.0))
+
+    grouped = g.groupby("player_id")
+    pp = grouped[cols].mean()
+    pp["gp"] = grouped.size()
+    pp["usage_per_min"] = (pp["fga"] + pp["fta"]) / pp["minutes"].where(pp["minutes"] != 0)
+    return pp
+
+def league_baseline_from_averages(pp: pd.DataFrame, season: Optional[str] = None) -> Dict:
+    """
+    League means, population stdevs, FG/FT impact stdevs and usage quantiles
+    from a per_player_averages() frame. Same shape as a league_pg_stats_by_season row.
+    """
+    cats = pp[BASELINE_CATS]
+    means = cats.mean()
+    stds = cats.std(ddof=0)
+    s_fg_imp = ((pp["fg_pct"] - means["fg_pct"]) * pp["fga"]).std(ddof=0)
+    s_ft_imp = ((pp["ft_pct"] - means["ft_pct"]) * pp["fta"]).std(ddof=0)
+
+    usage = pp["usage_per_min"].dropna().to_numpy(dtype=float)
+    # inverted_cdf returns observed values, like APPROX_QUANTILES, rather than interpolating
+    q = (np.quantile(usage, np.linspace(0.0, 1.0, USAGE_QUANTILES + 1), method="inverted_cdf")
+         if len(usage) else np.empty(0))
+
+    def _f(x):
+        return None if pd.isna(x) else float(x)
+
+    return {
+        "season": season,
+        "means": {k: _f(means[c]) for k, c in zip(MEAN_KEYS, BASELINE_CATS)},
+        "stds": {**{k: _f(stds[c]) for k, c in zip(STD_KEYS, BASELINE_CATS)},
+                 "s_fg_imp": _f(s_fg_imp), "s_ft_imp": _f(s_ft_imp)},
+        "usage_q101": q.tolist(),
+    }
+
+def compute_league_baseline(games: pd.DataFrame,
+                            season: Optional[str] = None,
+                            start: Optional[date] = None,
+                            end: Optional[date] = None) -> Dict:
+    """
+    Per-player averages, then the league distribution over players.
+    Pass start/end to build a baseline for a custom date range.
+    """
+    return league_baseline_from_averages(per_player_averages(games, start, end), season)
+
+def usage_percentiles(values, usage_q101) -> np.ndarray:
+    """
+    Vectorized usage proxy: index of the last quantile <= value (0..101),
+    NaN when the value is missing or below every quantile.
+    """
+    q = np.asarray([v for v in usage_q101 if v is not None], dtype=float)
+    x = np.asarray(values, dtype=float)
+    idx = (np.searchsorted(q, x, side="right") - 1).astype(float)
+    idx[np.isnan(x) | (idx < 0)] = np.nan
+    return idx
+
+def usage_percentile(value, usage_q101) -> Optional[int]:
+    p = usage_percentiles([np.nan if value is None else value], usage_q101)[0]
+    return None if np.isnan(p) else int(p)
+
+# Turnovers count against the total, as in get_player_baselines_v1
+CAT_SIGN = np.array([1, 1, 1, 1, 1, 1, 1, 1, -1], dtype=float)
+FG_IDX, FT_IDX = BASELINE_CATS.index("fg_pct"), BASELINE_CATS.index("ft_pct")
+
+def baseline_zscores(pp: pd.DataFrame, baseline: Dict) -> np.ndarray:
+    """
+    (n_players, 9) z matrix in BASELINE_CATS order for per-player averages against
+    a league baseline row. FG%/FT% are attempt-weighted impacts over s_fg_imp/s_ft_imp.
+    NaN where an input is missing or the league stdev is 0 (SAFE_DIVIDE semantics).
+    """
+    means = np.array([baseline["means"][k] for k in MEAN_KEYS], dtype=float)
+    stds = np.array([baseline["stds"][k] for k in STD_KEYS], dtype=float)
+    stds[FG_IDX] = np.nan if baseline["stds"]["s_fg_imp"] is None else baseline["stds"]["s_fg_imp"]
+    stds[FT_IDX] = np.nan if baseline["stds"]["s_ft_imp"] is None else baseline["stds"]["s_ft_imp"]
+
+    diff = pp[BASELINE_CATS].to_numpy(dtype=float) - means
+    diff[:, FG_IDX] *= pp["fga"].to_numpy(dtype=float)
+    diff[:, FT_IDX] *= pp["fta"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return diff / np.where(stds == 0, np.nan, stds)
+
+def z_totals(z: np.ndarray) -> np.ndarray:
+    """Signed 9-cat total per row; missing categories count as 0."""
+    return np.nansum(z * CAT_SIGN, axis=-1)
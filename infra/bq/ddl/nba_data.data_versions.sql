@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS `fantasy-survivor-app.nba_data.data_versions` (
+  season STRING,
+  game_date DATE,
+  version STRING,
+  rows INT64,
+  loaded_at TIMESTAMP
+)
+CLUSTER BY season, game_date;
@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS `fantasy-survivor-app.nba_data.intraday_state` (
+  game_date DATE,
+  state STRING,
+  updated_at TIMESTAMP
+);
@@ -1,5 +1,8 @@
 # daily_ingest.py
+import os
+import re
 import time
+import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
 import numpy as np
@@ -92,20 +95,96 @@ def run_ingestion(target_date: datetime | None = None, season: str = "2024-25")
         df = fetch_boxscore(gid)
         if df.empty:
             continue
-        # Keep only the columns we need; BoxScoreTraditionalV2 provides these names
-        cols = [
-            "GAME_ID", "PLAYER_ID", "PLAYER_NAME", "TEAM_ABBREVIATION", "MIN",
-            "FGM", "FGA", "FG_PCT",
-            "FG3M", "FG3A", "FG3_PCT",
-            "FTM", "FTA", "FT_PCT",
-            "OREB", "DREB", "REB",
-            "AST", "STL", "BLK", "TO", "PF", "PTS",
-        ]
-        df = df[cols].copy()
-        df["GAME_ID"] = df["GAME_ID"].astype(str)
-        frames.append(df)
+        frames.append(select_box_columns(df))
         time.sleep(0.4)  # be polite to the stats API
 
+    return build_rows(frames, target_date)
+
+# Keep only the columns we need; BoxScoreTraditionalV2 provides these names
+BOX_COLS = [
+    "GAME_ID", "PLAYER_ID", "PLAYER_NAME", "TEAM_ABBREVIATION", "MIN",
+    "FGM", "FGA", "FG_PCT",
+    "FG3M", "FG3A", "FG3_PCT",
+    "FTM", "FTA", "FT_PCT",
+    "OREB", "DREB", "REB",
+    "AST", "STL", "BLK", "TO", "PF", "PTS",
+]
+
+def select_box_columns(box: pd.DataFrame) -> pd.DataFrame:
+    df = box[BOX_COLS].copy()
+    df["GAME_ID"] = df["GAME_ID"].astype(str)
+    return df
+
+# BigQuery type of each column build_rows() produces, in the live table's column order
+# (infra/bq/schema/nba_data.player_daily_game_stats_p.schema.json); checked before fetching
+INGEST_SCHEMA = {
+    "game_id": "INTEGER",
+    "player_id": "INTEGER",
+    "player_name": "STRING",
+    "min": "FLOAT",
+    "fgm": "INTEGER",
+    "fga": "INTEGER",
+    "fg_pct": "FLOAT",
+    "fg3m": "INTEGER",
+    "fg3a": "INTEGER",
+    "fg3_pct": "FLOAT",
+    "ftm": "INTEGER",
+    "fta": "INTEGER",
+    "ft_pct": "FLOAT",
+    "pts": "INTEGER",
+    "reb": "INTEGER",
+    "ast": "INTEGER",
+    "stl": "INTEGER",
+    "blk": "INTEGER",
+    "turnovers": "INTEGER",
+    "pf": "INTEGER",
+    "dreb": "INTEGER",
+    "oreb": "INTEGER",
+    "z_score": "FLOAT",
+    "game_date": "DATE",
+}
+NUMERIC_TYPES = {"INTEGER", "FLOAT", "NUMERIC", "BIGNUMERIC"}
+
+LEAGUE_SQL = Path(__file__).resolve().parents[1] / "infra" / "bq" / "sql" / "create_league_pg_stats_by_season.sql"
+
+def league_sql_columns(sql: str) -> dict[str, set[str]]:
+    """
+    Columns the league stats SQL reads from each source table (full table id), taken from
+    its `alias.column` references and USING join keys.
+    """
+    aliases = {alias: tbl for tbl, alias in re.findall(r"(?:FROM|JOIN)\s+`([^`]+)`\s+(\w+)", sql)}
+    cols: dict[str, set[str]] = {tbl: set() for tbl in aliases.values()}
+    for alias, col in re.findall(r"\b(\w+)\.(\w+)\b", sql):
+        if alias in aliases:
+            cols[aliases[alias]].add(col)
+    for keys in re.findall(r"USING\s*\(([^)]*)\)", sql):
+        for tbl in cols:
+            cols[tbl].update(k.strip() for k in keys.split(","))
+    return cols
+
+def check_ingest_schema(client: bigquery.Client, table: str) -> list[str]:
+    """
+    Columns in INGEST_SCHEMA that the live table lacks or types incompatibly, and columns
+    the league stats SQL reads that its source tables lack.
+    Numeric types are interchangeable (the load casts them).
+    """
+    live = {f.name: f.field_type for f in client.get_table(table).schema}
+    problems = []
+    for col, typ in INGEST_SCHEMA.items():
+        if col not in live:
+            problems.append(f"missing column {col}")
+        elif live[col] != typ and not (typ in NUMERIC_TYPES and live[col] in NUMERIC_TYPES):
+            problems.append(f"column {col}: ingest writes {typ}, table has {live[col]}")
+    for src, cols in league_sql_columns(LEAGUE_SQL.read_text()).items():
+        src_live = live if src == table else {f.name for f in client.get_table(src).schema}
+        problems += [f"{LEAGUE_SQL.name} reads {src.split('.')[-1]}.{c}, which doesn't exist"
+                     for c in sorted(cols) if c not in src_live]
+    return problems
+
+def build_rows(frames: list[pd.DataFrame], target_date: datetime) -> pd.DataFrame:
+    """
+    Score box-score frames and shape them like player_daily_game_stats_p rows.
+    """
     if not frames:
         return pd.DataFrame()
 
@@ -114,61 +193,154 @@ def run_ingestion(target_date: datetime | None = None, season: str = "2024-25")
 
     # Build final frame matching BigQuery table schema
     all_df["game_date"] = target_date.date()
-    all_df["season"] = all_df["game_date"].apply(_season_from_date)
+
+    def _int(col):
+        return pd.to_numeric(all_df[col], errors="coerce").astype("Int64")
+
+    def _float(col):
+        return pd.to_numeric(all_df[col], errors="coerce").astype(float)
 
     out = pd.DataFrame({
-        "game_date": all_df["game_date"],
-        "game_id": all_df["GAME_ID"].astype(str),
-        "player_id": all_df["PLAYER_ID"].astype("Int64"),
+        "game_id": all_df["GAME_ID"].astype(str).str.lstrip("0").astype("Int64"),
+        "player_id": _int("PLAYER_ID"),
         "player_name": all_df["PLAYER_NAME"].astype(str),
-        "team_abbr": all_df["TEAM_ABBREVIATION"].astype(str),
-        "minutes": all_df["MIN_INT"].astype("Int64"),
-        "pts": all_df["PTS"].astype(float),
-        "reb": all_df["REB"].astype(float),
-        "ast": all_df["AST"].astype(float),
-        "stl": all_df["STL"].astype(float),
-        "blk": all_df["BLK"].astype(float),
-        "fg3m": all_df["FG3M"].astype(float),
-        "fg_pct": all_df["FG_PCT"].astype(float),
-        "ft_pct": all_df["FT_PCT"].astype(float),
-        "turnovers": all_df["TO"].astype(float),
-        "z_score": all_df["Z_SCORE"].astype(float),
-    })
+        "min": _float("MIN_INT"),
+        "fgm": _int("FGM"),
+        "fga": _int("FGA"),
+        "fg_pct": _float("FG_PCT"),
+        "fg3m": _int("FG3M"),
+        "fg3a": _int("FG3A"),
+        "fg3_pct": _float("FG3_PCT"),
+        "ftm": _int("FTM"),
+        "fta": _int("FTA"),
+        "ft_pct": _float("FT_PCT"),
+        "pts": _int("PTS"),
+        "reb": _int("REB"),
+        "ast": _int("AST"),
+        "stl": _int("STL"),
+        "blk": _int("BLK"),
+        "turnovers": _int("TO"),
+        "pf": _int("PF"),
+        "dreb": _int("DREB"),
+        "oreb": _int("OREB"),
+        "z_score": _float("Z_SCORE"),
+        "game_date": all_df["game_date"],
+    })[list(INGEST_SCHEMA)]
 
     # Drop DNP rows (no minutes parsed)
-    out = out[out["minutes"].notna()].reset_index(drop=True)
+    out = out[out["min"].notna()].reset_index(drop=True)
     return out
 
 from pathlib import Path
 from google.cloud import bigquery
 
+# Bytes-billed cap for the league stats rebuild (BigQuery fails the job above this)
+REFRESH_MAX_BYTES = int(os.getenv("BQ_MAX_BYTES_REFRESH", str(5 * 1024 ** 3)))
+
 def refresh_league_pg_stats():
     client = bigquery.Client(project="fantasy-survivor-app")
-    sql_path = Path(__file__).resolve().parents[1] / "infra" / "bq" / "sql" / "create_league_pg_stats_by_season.sql"
-    job = client.query(sql_path.read_text(), location="northamerica-northeast1")
+    t0 = time.perf_counter()
+    job = client.query(
+        LEAGUE_SQL.read_text(),
+        job_config=bigquery.QueryJobConfig(maximum_bytes_billed=REFRESH_MAX_BYTES),
+        location="northamerica-northeast1",
+    )
     job.result()
-    print("Refreshed league_pg_stats_by_season ✅")
+    print(f"Refreshed league_pg_stats_by_season ✅ "
+          f"(bytes_processed={job.total_bytes_processed}, bytes_billed={job.total_bytes_billed}, "
+          f"slot_ms={job.slot_millis}, cache_hit={job.cache_hit}, {time.perf_counter() - t0:.1f}s)")
+
+TABLE_VERSIONS = "fantasy-survivor-app.nba_data.data_versions"
+
+def upsert_rows(client: bigquery.Client, df: pd.DataFrame, table: str, game_date) -> None:
+    """
+    Load df into a per-call staging copy of table, then MERGE on (game_date, game_id,
+    player_id) within the game_date partition: existing rows are updated, new ones inserted.
+    The staging table is dropped afterwards (and expires after a day if we crash first).
+    """
+    staging = f"{table}_staging_{uuid.uuid4().hex[:12]}"  # unique, so overlapping runs can't collide
+    client.query(
+        f"""
+        CREATE TABLE `{staging}` LIKE `{table}`
+        OPTIONS (expiration_timestamp = TIMESTAMP_ADD(CURRENT_TIMESTAMP(), INTERVAL 1 DAY))
+        """,
+        location="northamerica-northeast1",
+    ).result()
+    try:
+        client.load_table_from_dataframe(
+            df, staging,
+            job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")
+        ).result()
+
+        cols = list(df.columns)
+        updates = ", ".join(f"{c} = S.{c}" for c in cols)
+        names = ", ".join(cols)
+        client.query(
+            f"""
+            MERGE `{table}` T
+            USING `{staging}` S
+            ON T.game_date = @game_date AND T.game_date = S.game_date
+               AND T.game_id = S.game_id AND T.player_id = S.player_id
+            WHEN MATCHED THEN UPDATE SET {updates}
+            WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({names})
+            """,
+            job_config=bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("game_date", "DATE", game_date),
+            ]),
+            location="northamerica-northeast1",
+        ).result()
+    finally:
+        client.delete_table(staging, not_found_ok=True)
+
+def stamp_data_version(client: bigquery.Client, game_date, rows: int) -> str:
+    """
+    Record a new data version for game_date; the API derives ETags and cache refreshes from it.
+    """
+    version = uuid.uuid4().hex
+    client.query(
+        f"""
+        INSERT INTO `{TABLE_VERSIONS}` (season, game_date, version, rows, loaded_at)
+        VALUES (@season, @game_date, @version, @rows, CURRENT_TIMESTAMP())
+        """,
+        job_config=bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("season", "STRING", _season_from_date(game_date)),
+            bigquery.ScalarQueryParameter("game_date", "DATE", game_date),
+            bigquery.ScalarQueryParameter("version", "STRING", version),
+            bigquery.ScalarQueryParameter("rows", "INT64", rows),
+        ]),
+        location="northamerica-northeast1",
+    ).result()
+    print(f"Stamped data version {version} for {game_date}")
+    return version
 
 # ----------------------------
 # Main
 # ----------------------------
 if __name__ == "__main__":
-    target_date = datetime.today() - timedelta(days=1)
-    df = run_ingestion(target_date)
+    # TARGET_DATE (YYYY-MM-DD) is set by the trigger service; default is yesterday
+    if os.getenv("TARGET_DATE"):
+        target_date = datetime.strptime(os.environ["TARGET_DATE"], "%Y-%m-%d")
+    else:
+        target_date = datetime.today() - timedelta(days=1)
+    client = bigquery.Client(project="fantasy-survivor-app")
+    table = "fantasy-survivor-app.nba_data.player_daily_game_stats_p"
+
+    # Fail before hitting the stats API if the rows couldn't be loaded anyway
+    problems = check_ingest_schema(client, table)
+    if problems:
+        raise SystemExit(f"Schema drift in {table}: " + "; ".join(problems))
+
+    df = run_ingestion(target_date, season=_season_from_date(target_date.date()))
 
     if df.empty:
         print("No rows to load.")
     else:
-        client = bigquery.Client(project="fantasy-survivor-app")
-        table = "fantasy-survivor-app.nba_data.player_daily_game_stats_p"
-
-        # Load (df columns must match table schema)
-        job = client.load_table_from_dataframe(
-            df, table,
-            job_config=bigquery.LoadJobConfig(write_disposition="WRITE_APPEND")
-        )
-        job.result()
+        # Upsert, so games already loaded by intraday_ingest aren't duplicated
+        upsert_rows(client, df, table, target_date.date())
         print(f"Loaded {len(df)} rows into {table} for {target_date.date()}")
+        # Stamp now, so a failed league refresh below can't leave API caches on pre-load data
+        stamp_data_version(client, target_date.date(), len(df))
 
-        # Update precomputed league stats
+        # Update precomputed league stats, then stamp again so league-derived caches move too
         refresh_league_pg_stats()
+        stamp_data_version(client, target_date.date(), len(df))
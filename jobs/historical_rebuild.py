@@ -0,0 +1,258 @@
+# historical_rebuild.py
+"""
+Rebuild player_historical_game_stats_p for one or more seasons.
+
+Seasons are fetched in parallel (one process per season), box scores are fetched
+with an on-disk cache and one rate limit shared by all workers (every attempt,
+retries included), and each season is written to its own Parquet file before being
+bulk-loaded. Games that still fail after retries, or come back empty, are logged and
+skipped; rerunning picks them up (cached games aren't refetched). With --replace,
+seasons with failed games aren't loaded, so existing rows aren't swapped for a
+partial season.
+
+Usage:
+  python historical_rebuild.py --seasons 2015-16:2024-25 --workers 4 --load --replace
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from google.cloud import bigquery
+from nba_api.stats.endpoints import BoxScoreTraditionalV2, LeagueGameLog
+
+PROJECT = "fantasy-survivor-app"
+LOC = "northamerica-northeast1"
+TABLE_HIST = "fantasy-survivor-app.nba_data.player_historical_game_stats_p"
+
+# BoxScoreTraditionalV2 column -> player_historical_game_stats_p column
+COLUMN_MAPPING = {
+    "SEASON": "season",
+    "GAME_ID": "game_id",
+    "TEAM_ID": "team_id",
+    "TEAM_ABBREVIATION": "team_abbreviation",
+    "PLAYER_ID": "player_id",
+    "PLAYER_NAME": "player_name",
+    "START_POSITION": "start_position",
+    "COMMENT": "comment",
+    "MIN": "minute",
+    "FGM": "fg_made",
+    "FGA": "fg_attempts",
+    "FG_PCT": "fg_pct",
+    "FG3M": "three_p_made",
+    "FG3A": "three_p_attempts",
+    "FG3_PCT": "three_p_pct",
+    "FTM": "ft_made",
+    "FTA": "ft_attempts",
+    "FT_PCT": "ft_pct",
+    "OREB": "offensive_rebounds",
+    "DREB": "defensive_rebounds",
+    "REB": "rebounds",
+    "AST": "assists",
+    "STL": "steals",
+    "BLK": "blocks",
+    "TO": "turnovers",
+    "PF": "personal_fouls",
+    "PTS": "points",
+    "PLUS_MINUS": "plus_minus",
+    "DOUBLE_DOUBLE": "double_double",
+    "TRIPLE_DOUBLE": "triple_double",
+    "GAME_DATE": "game_date",
+}
+INT_COLS = ["game_id", "team_id", "player_id", "fg_made", "fg_attempts", "three_p_made",
+            "three_p_attempts", "ft_made", "ft_attempts", "offensive_rebounds",
+            "defensive_rebounds", "rebounds", "assists", "steals", "blocks", "turnovers",
+            "personal_fouls", "points"]
+FLOAT_COLS = ["minute", "fg_pct", "three_p_pct", "ft_pct", "plus_minus"]
+
+# ----------------------------
+# Helpers
+# ----------------------------
+class _Value:
+    def __init__(self, value: float):
+        self.value = value
+
+
+class RateLimiter:
+    """
+    Minimum spacing between stats API calls. Pass a multiprocessing.Manager lock and
+    Value to share one limit across worker processes; defaults are per-process.
+    """
+    def __init__(self, min_interval: float, lock=None, last=None):
+        self.min_interval = min_interval
+        self._lock = lock if lock is not None else threading.Lock()
+        self._last = last if last is not None else _Value(0.0)
+
+    def wait(self):
+        # hold the lock while sleeping, so callers are spaced out one after another
+        with self._lock:
+            delay = self._last.value + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._last.value = time.monotonic()
+
+def parse_seasons(spec: list[str]) -> list[str]:
+    """Accept explicit seasons ("2021-22") and inclusive ranges ("2015-16:2024-25")."""
+    out: list[str] = []
+    for s in spec:
+        if ":" in s:
+            a, b = (int(x.split("-")[0]) for x in s.split(":"))
+            out += [f"{y}-{(y + 1) % 100:02d}" for y in range(a, b + 1)]
+        else:
+            out.append(s)
+    return out
+
+def get_season_games(season: str, limiter: RateLimiter, retries: int = 3) -> pd.DataFrame:
+    for attempt in range(retries):
+        try:
+            limiter.wait()
+            log = LeagueGameLog(
+                season=season,
+                season_type_all_star="Regular Season",
+                player_or_team_abbreviation="T",
+                timeout=30,
+            )
+            df = log.get_data_frames()[0]
+            df["GAME_DATE"] = pd.to_datetime(df["GAME_DATE"]).dt.date
+            return df[["GAME_ID", "GAME_DATE"]].drop_duplicates("GAME_ID").reset_index(drop=True)
+        except Exception as e:  # timeouts, resets, throttled (non-JSON) responses
+            print(f"[{season}] LeagueGameLog failed ({e}), retry {attempt + 1}/{retries}")
+            time.sleep(5 * (attempt + 1))
+    raise RuntimeError(f"LeagueGameLog failed for {season}")
+
+def cached_boxscore(game_id: str, cache_dir: Path, limiter: RateLimiter, retries: int = 3) -> pd.DataFrame:
+    path = cache_dir / f"{game_id}.parquet"
+    if path.exists():
+        return pd.read_parquet(path)
+    for attempt in range(retries):
+        limiter.wait()
+        try:
+            df = BoxScoreTraditionalV2(game_id=game_id, timeout=30).get_data_frames()[0]
+            if df.empty:  # the game is in LeagueGameLog, so it has players
+                raise ValueError("empty box score")
+            break
+        except Exception as e:  # timeouts, resets, throttled (non-JSON) responses
+            if attempt == retries - 1:
+                raise
+            print(f"Error fetching {game_id} ({e}), retry {attempt + 1}/{retries}")
+            time.sleep(5 * (attempt + 1))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, index=False)
+    return df
+
+def to_historical_rows(box: pd.DataFrame, season: str, game_date) -> pd.DataFrame:
+    df = box.copy()
+    df["SEASON"] = season
+    df["GAME_DATE"] = game_date
+    df["GAME_ID"] = df["GAME_ID"].astype(str).str.lstrip("0")
+    df["MIN"] = df["MIN"].apply(
+        lambda x: int(float(x.split(":")[0])) if pd.notnull(x) and isinstance(x, str) else None
+    )
+
+    tens = (df[["PTS", "REB", "AST", "BLK", "STL"]].fillna(0) >= 10).sum(axis=1)
+    df["DOUBLE_DOUBLE"] = tens >= 2
+    df["TRIPLE_DOUBLE"] = tens >= 3
+
+    df = df[list(COLUMN_MAPPING)].rename(columns=COLUMN_MAPPING)
+    df[INT_COLS] = df[INT_COLS].apply(pd.to_numeric, errors="coerce").astype("Int64")
+    df[FLOAT_COLS] = df[FLOAT_COLS].apply(pd.to_numeric, errors="coerce").astype(float)
+    return df
+
+def rebuild_season(season: str, outdir: str, cache_dir: str,
+                   limiter: RateLimiter) -> tuple[str, str, int, float, list[str]]:
+    """Fetch one season and write it to Parquet. Runs in a worker process."""
+    t0 = time.perf_counter()
+    games = get_season_games(season, limiter)
+
+    frames: list[pd.DataFrame] = []
+    failed: list[str] = []
+    for gid, gdate in games.itertuples(index=False):
+        try:
+            box = cached_boxscore(str(gid), Path(cache_dir) / season, limiter)
+        except Exception as e:
+            print(f"[{season}] skipping {gid}: {e}")
+            failed.append(str(gid))
+            continue
+        frames.append(to_historical_rows(box, season, gdate))
+
+    out = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=list(COLUMN_MAPPING.values()))
+    path = Path(outdir) / f"player_historical_game_stats_{season}.parquet"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    out.to_parquet(path, index=False)
+    return season, str(path), len(out), time.perf_counter() - t0, failed
+
+def load_parquet(paths: list[str], seasons: list[str], replace: bool):
+    client = bigquery.Client(project=PROJECT)
+    if replace:
+        client.query(
+            f"DELETE FROM `{TABLE_HIST}` WHERE season IN UNNEST(@seasons)",
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[bigquery.ArrayQueryParameter("seasons", "STRING", seasons)]
+            ),
+            location=LOC,
+        ).result()
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition="WRITE_APPEND",
+    )
+    jobs = []
+    for p in paths:
+        with open(p, "rb") as fh:
+            jobs.append(client.load_table_from_file(fh, TABLE_HIST, job_config=job_config, location=LOC))
+    for job in jobs:
+        job.result()
+    print(f"Loaded {len(paths)} season file(s) into {TABLE_HIST} ✅")
+
+# ----------------------------
+# Main
+# ----------------------------
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seasons", nargs="+", required=True, help='e.g. 2021-22 2022-23 or 2015-16:2024-25')
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--outdir", default="out/historical")
+    ap.add_argument("--cache-dir", default="out/boxscore_cache")
+    ap.add_argument("--min-interval", type=float, default=0.6,
+                    help="seconds between stats API calls, across all workers")
+    ap.add_argument("--load", action="store_true", help="bulk-load the Parquet files into BigQuery")
+    ap.add_argument("--replace", action="store_true", help="delete existing rows for these seasons first")
+    args = ap.parse_args()
+
+    seasons = parse_seasons(args.seasons)
+    t0 = time.perf_counter()
+    paths: dict[str, str] = {}
+    failed_games: dict[str, list[str]] = {}
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(seasons)))) as pool:
+        limiter = RateLimiter(args.min_interval, manager.Lock(), manager.Value("d", 0.0))
+        futures = {pool.submit(rebuild_season, s, args.outdir, args.cache_dir, limiter): s for s in seasons}
+        for fut in as_completed(futures):
+            try:
+                season, path, rows, secs, failed = fut.result()
+            except Exception as e:
+                print(f"[{futures[fut]}] failed: {e}")
+                continue
+            paths[season] = path
+            if failed:
+                failed_games[season] = failed
+            print(f"[{season}] {rows} rows -> {path} in {secs:.1f}s ({len(failed)} game(s) failed)")
+    print(f"Fetched {len(paths)}/{len(seasons)} season(s) in {time.perf_counter() - t0:.1f}s")
+    for season, games in sorted(failed_games.items()):
+        print(f"[{season}] failed games: {', '.join(games)}")
+
+    done = [s for s in seasons if s in paths]  # never --replace a season we couldn't fetch
+    if args.replace:
+        for s in (s for s in done if s in failed_games):
+            print(f"[{s}] not loaded: --replace would drop the rows of its {len(failed_games[s])} "
+                  f"failed game(s); rerun to fetch them")
+        done = [s for s in done if s not in failed_games]
+    if args.load and done:
+        load_parquet([paths[s] for s in done], done, args.replace)
+    print(f"Total {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# intraday_ingest.py
+"""
+Polling ingest for game nights: only games that are live or newly final are
+re-fetched, and only box scores whose content changed are re-scored and upserted.
+
+Per game we keep the last seen status (1 scheduled, 2 live, 3 final) and a hash
+of the last box score. The state is saved after every cycle to nba_data.intraday_state
+(one JSON row per game date), so a restarted or scheduled --once run resumes where the
+previous execution stopped; --state FILE keeps it in a local file instead (dev runs).
+
+Usage:
+  python intraday_ingest.py --date 2025-01-02 --interval 180
+  python intraday_ingest.py --once            # single cycle, e.g. from a scheduler
+  python intraday_ingest.py --once --state intraday_state.json
+"""
+import argparse
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+from google.cloud import bigquery
+from nba_api.stats.endpoints import ScoreboardV2
+from requests.exceptions import ReadTimeout
+
+from daily_ingest import (fetch_boxscore, select_box_columns, build_rows, upsert_rows,
+                          stamp_data_version, refresh_league_pg_stats, check_ingest_schema, mmddyyyy)
+
+TABLE = "fantasy-survivor-app.nba_data.player_daily_game_stats_p"
+STATE_TABLE = "fantasy-survivor-app.nba_data.intraday_state"
+LOC = "northamerica-northeast1"
+LIVE, FINAL = 2, 3
+# NBA game dates are US/Eastern; a late game is still "today" there after midnight UTC
+GAME_TZ = ZoneInfo("America/New_York")
+
+# ----------------------------
+# Helpers
+# ----------------------------
+def get_slate(target_date: datetime, retries: int = 3) -> dict[str, int]:
+    """game_id -> GAME_STATUS_ID for every game on target_date."""
+    for attempt in range(retries):
+        try:
+            sb = ScoreboardV2(game_date=mmddyyyy(target_date), timeout=15)
+            header = sb.game_header.get_data_frame()
+            return {str(g): int(s) for g, s in zip(header["GAME_ID"], header["GAME_STATUS_ID"])}
+        except ReadTimeout:
+            time.sleep(2 * (attempt + 1))
+    return {}
+
+def box_hash(box: pd.DataFrame) -> str:
+    return hashlib.sha1(pd.util.hash_pandas_object(box, index=False).values.tobytes()).hexdigest()
+
+def load_state(client: bigquery.Client, path: Path | None, day: str) -> dict:
+    """Saved state for day from the local file, or from STATE_TABLE when no file is given."""
+    state = None
+    if path:
+        if path.exists():
+            state = json.loads(path.read_text())
+    else:
+        rows = list(client.query(
+            f"SELECT state FROM `{STATE_TABLE}` WHERE game_date = @day ORDER BY updated_at DESC LIMIT 1",
+            job_config=bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("day", "DATE", day),
+            ]),
+            location=LOC,
+        ).result())
+        state = json.loads(rows[0]["state"]) if rows else None
+    if state and state.get("date") == day:
+        return state
+    return {"date": day, "games": {}, "league_refreshed": False}
+
+def save_state(client: bigquery.Client, path: Path | None, state: dict):
+    if path:
+        path.write_text(json.dumps(state, indent=2))
+        return
+    client.query(
+        f"""
+        MERGE `{STATE_TABLE}` T
+        USING (SELECT @day AS game_date, @state AS state) S
+        ON T.game_date = S.game_date
+        WHEN MATCHED THEN UPDATE SET state = S.state, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (game_date, state, updated_at)
+          VALUES (S.game_date, S.state, CURRENT_TIMESTAMP())
+        """,
+        job_config=bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("day", "DATE", state["date"]),
+            bigquery.ScalarQueryParameter("state", "STRING", json.dumps(state, sort_keys=True)),
+        ]),
+        location=LOC,
+    ).result()
+
+def games_to_fetch(slate: dict[str, int], games: dict) -> list[str]:
+    """Live games, plus final games we haven't captured in their final state."""
+    out = []
+    for gid, status in slate.items():
+        prev = games.get(gid, {})
+        if status == LIVE or (status == FINAL and prev.get("status") != FINAL):
+            out.append(gid)
+    return out
+
+def run_cycle(client: bigquery.Client, target_date: datetime, state: dict) -> int:
+    """One poll. Returns the number of upserted rows."""
+    slate = get_slate(target_date)
+    changed: list[pd.DataFrame] = []
+
+    for gid in games_to_fetch(slate, state["games"]):
+        box = fetch_boxscore(gid)
+        time.sleep(0.4)  # be polite to the stats API
+        if box.empty:
+            continue
+        box = select_box_columns(box)
+        h = box_hash(box)
+        prev = state["games"].get(gid, {})
+        if h != prev.get("hash"):
+            changed.append(box)
+        state["games"][gid] = {"status": slate[gid], "hash": h}
+
+    # scheduled games: record status only
+    for gid, status in slate.items():
+        state["games"].setdefault(gid, {"status": status, "hash": None})
+
+    rows = build_rows(changed, target_date)
+    if not rows.empty:
+        upsert_rows(client, rows, TABLE, target_date.date())
+        stamp_data_version(client, target_date.date(), len(rows))
+    print(f"{datetime.now():%H:%M:%S} slate={len(slate)} changed_games={len(changed)} rows={len(rows)}")
+    return len(rows)
+
+def slate_done(state: dict) -> bool:
+    games = state["games"].values()
+    return bool(games) and all(g["status"] == FINAL and g["hash"] for g in games)
+
+# ----------------------------
+# Main
+# ----------------------------
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--date", default=None, help="YYYY-MM-DD, default today in US/Eastern")
+    ap.add_argument("--interval", type=int, default=180, help="seconds between polls")
+    ap.add_argument("--once", action="store_true")
+    ap.add_argument("--state", default=None, help="local JSON state file; default is the BigQuery state table")
+    ap.add_argument("--max-hours", type=float, default=8.0)
+    args = ap.parse_args()
+
+    if args.date:
+        target_date = datetime.strptime(args.date, "%Y-%m-%d")
+    else:
+        target_date = datetime.combine(datetime.now(GAME_TZ).date(), datetime.min.time())
+    state_path = Path(args.state) if args.state else None
+    client = bigquery.Client(project="fantasy-survivor-app")
+    problems = check_ingest_schema(client, TABLE)
+    if problems:
+        raise SystemExit(f"Schema drift in {TABLE}: " + "; ".join(problems))
+    state = load_state(client, state_path, target_date.date().isoformat())
+
+    deadline = datetime.now() + timedelta(hours=args.max_hours)
+    while True:
+        run_cycle(client, target_date, state)
+        save_state(client, state_path, state)
+
+        if slate_done(state) and not state["league_refreshed"]:
+            refresh_league_pg_stats()
+            stamp_data_version(client, target_date.date(), 0)  # league stats changed too
+            state["league_refreshed"] = True
+            save_state(client, state_path, state)
+        if args.once or slate_done(state) or datetime.now() >= deadline:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,18 @@
 """
 Dump BigQuery DDL and schema JSON for all tables (and routines) in a dataset.
 
+Table metadata is fetched concurrently (--workers). Tables whose last_modified time
+and schema hash match the previous dump are skipped, and files are only rewritten
+when their content changes. That dump state lives outside the repo, in
+~/.cache/dump_bq_metadata/<project>.<dataset>.json (override with --state-file).
+
+--check compares live schemas against <outdir>/schema/*.json and against the
+columns jobs/daily_ingest.py writes (its INGEST_SCHEMA) and the columns the league
+stats SQL reads, and exits 1 on drift.
+
 Usage:
   python tools/dump_bq_metadata.py --project YOUR_PROJECT --dataset YOUR_DATASET --outdir infra/bq
+  python tools/dump_bq_metadata.py --project YOUR_PROJECT --dataset YOUR_DATASET --check
 
 Requires:
   pip install google-cloud-bigquery
@@ -11,10 +21,20 @@ Auth:
   gcloud auth application-default login
 """
 from __future__ import annotations
-import argparse, json, os, pathlib
+import argparse, ast, hashlib, json, os, pathlib, re, sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from google.cloud import bigquery
 
+STATE_DIR = pathlib.Path(os.getenv("XDG_CACHE_HOME", "~/.cache")).expanduser() / "dump_bq_metadata"
+INGEST_SOURCE = pathlib.Path(__file__).resolve().parents[1] / "jobs" / "daily_ingest.py"
+INGEST_TABLE = "player_daily_game_stats_p"
+LEAGUE_SQL = pathlib.Path(__file__).resolve().parents[1] / "infra" / "bq" / "sql" / "create_league_pg_stats_by_season.sql"
+
+# INFORMATION_SCHEMA (standard SQL) type names -> schema JSON (legacy) names
+TYPE_ALIASES = {"INT64": "INTEGER", "FLOAT64": "FLOAT", "BOOL": "BOOLEAN", "STRUCT": "RECORD"}
+NUMERIC_TYPES = {"INTEGER", "FLOAT", "NUMERIC", "BIGNUMERIC"}
+
 def to_schema_json(fields):
     def field_to_dict(f):
         d = {
@@ -28,25 +48,156 @@ def to_schema_json(fields):
         return d
     return [field_to_dict(f) for f in fields]
 
-def write_text(path: pathlib.Path, text: str):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(text if text.endswith("\n") else text + "\n", encoding="utf-8")
+def schema_hash(schema_json) -> str:
+    return hashlib.sha256(json.dumps(schema_json, sort_keys=True).encode()).hexdigest()[:16]
 
-def write_json(path: pathlib.Path, obj: Any):
+def write_text(path: pathlib.Path, text: str) -> bool:
+    """Write only if the content changed. Returns whether the file was written."""
+    text = text if text.endswith("\n") else text + "\n"
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    path.write_text(text, encoding="utf-8")
+    return True
+
+def write_json(path: pathlib.Path, obj: Any) -> bool:
+    return write_text(path, json.dumps(obj, indent=2, ensure_ascii=False))
+
+def load_state(path: pathlib.Path) -> dict:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+def table_schema_json(client: bigquery.Client, tbl_ref: str, table_type: str) -> dict:
+    tbl = client.get_table(tbl_ref)
+    tp = getattr(tbl, "time_partitioning", None)
+    return {
+        "table": tbl_ref,
+        "type": table_type,
+        "partitioning": tp.type_ if tp else None,
+        "partition_field": tp.field if tp else None,
+        "clustering_fields": getattr(tbl, "clustering_fields", None),
+        "schema": to_schema_json(tbl.schema),
+    }
+
+# ----------------------------
+# Drift check
+# ----------------------------
+def normalize_type(t: str) -> str:
+    t = t.upper()
+    if t.startswith("ARRAY<"):
+        t = t[len("ARRAY<"):-1]
+    t = t.split("<")[0].split("(")[0]
+    return TYPE_ALIASES.get(t, t)
+
+def live_columns(client: bigquery.Client, dataset_id: str) -> dict[str, dict[str, str]]:
+    """table -> {column: type} for every table in the dataset, in one query."""
+    sql = f"""
+    SELECT c.table_name, c.column_name, c.data_type
+    FROM `{dataset_id}.INFORMATION_SCHEMA.COLUMNS` c
+    JOIN `{dataset_id}.INFORMATION_SCHEMA.TABLES` t USING (table_name)
+    WHERE t.table_type IN ('BASE TABLE', 'EXTERNAL')
+    ORDER BY c.table_name, c.ordinal_position
+    """
+    tables: dict[str, dict[str, str]] = {}
+    for r in client.query(sql).result():
+        tables.setdefault(r["table_name"], {})[r["column_name"]] = normalize_type(r["data_type"])
+    return tables
+
+def committed_columns(out: pathlib.Path, dataset: str) -> dict[str, dict[str, str]]:
+    tables = {}
+    for path in sorted((out / "schema").glob(f"{dataset}.*.schema.json")):
+        name = path.name[len(dataset) + 1:-len(".schema.json")]
+        fields = json.loads(path.read_text(encoding="utf-8"))["schema"]
+        tables[name] = {f["name"]: normalize_type(f["type"]) for f in fields}
+    return tables
 
+def ingest_columns(path: pathlib.Path = INGEST_SOURCE) -> dict[str, str]:
+    """INGEST_SCHEMA from daily_ingest.py, read with ast so nba_api isn't needed."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "INGEST_SCHEMA" for t in node.targets):
+            return {k: normalize_type(v) for k, v in ast.literal_eval(node.value).items()}
+    raise ValueError(f"INGEST_SCHEMA not found in {path}")
+
+def league_sql_columns(path: pathlib.Path = LEAGUE_SQL) -> dict[str, set[str]]:
+    """Source table -> columns the league stats SQL reads (as daily_ingest.league_sql_columns)."""
+    sql = path.read_text(encoding="utf-8")
+    aliases = {alias: tbl for tbl, alias in re.findall(r"(?:FROM|JOIN)\s+`([^`]+)`\s+(\w+)", sql)}
+    cols: dict[str, set[str]] = {tbl: set() for tbl in aliases.values()}
+    for alias, col in re.findall(r"\b(\w+)\.(\w+)\b", sql):
+        if alias in aliases:
+            cols[aliases[alias]].add(col)
+    for keys in re.findall(r"USING\s*\(([^)]*)\)", sql):
+        for tbl in cols:
+            cols[tbl].update(k.strip() for k in keys.split(","))
+    return cols
+
+def diff_columns(expected: dict[str, str], live: dict[str, str], loose_numeric: bool = False) -> list[str]:
+    problems = [f"missing column {c}" for c in expected if c not in live]
+    problems += [f"unexpected column {c}" for c in live if c not in expected]
+    for c, t in expected.items():
+        lt = live.get(c)
+        if lt is None or lt == t or (loose_numeric and t in NUMERIC_TYPES and lt in NUMERIC_TYPES):
+            continue
+        problems.append(f"column {c}: expected {t}, live {lt}")
+    return problems
+
+def check(client: bigquery.Client, dataset_id: str, dataset: str, out: pathlib.Path) -> int:
+    live = live_columns(client, dataset_id)
+    committed = committed_columns(out, dataset)
+    drift = 0
+
+    for name in sorted(set(live) | set(committed)):
+        if name not in committed:
+            problems = ["no committed schema file"]
+        elif name not in live:
+            problems = ["committed schema but no live table"]
+        else:
+            problems = diff_columns(committed[name], live[name])
+        for p in problems:
+            print(f"❌ {dataset}.{name}: {p}")
+        drift += len(problems)
+
+    # ingest may omit nullable columns, and the load casts between numeric types
+    expected = ingest_columns()
+    problems = [p for p in diff_columns(expected, live.get(INGEST_TABLE, {}), loose_numeric=True)
+                if not p.startswith("unexpected column")]
+    for p in problems:
+        print(f"❌ ingest -> {dataset}.{INGEST_TABLE}: {p}")
+    drift += len(problems)
+
+    for src, cols in league_sql_columns().items():
+        src_dataset, _, name = src.rpartition(".")
+        if not src_dataset.endswith(dataset):
+            continue
+        for c in sorted(cols - set(live.get(name, {}))):
+            print(f"❌ {LEAGUE_SQL.name} -> {dataset}.{name}: missing column {c}")
+            drift += 1
+
+    print("✅ No schema drift" if not drift else f"{drift} schema problem(s)")
+    return 1 if drift else 0
+
+# ----------------------------
+# Main
+# ----------------------------
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--project", required=True)
     ap.add_argument("--dataset", required=True)
     ap.add_argument("--outdir", default="infra/bq")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--force", action="store_true", help="refetch every table, ignoring the dump state")
+    ap.add_argument("--state-file", default=None,
+                    help="dump state JSON (default ~/.cache/dump_bq_metadata/<project>.<dataset>.json)")
+    ap.add_argument("--check", action="store_true", help="only report schema drift; exit 1 if any")
     args = ap.parse_args()
 
     client = bigquery.Client(project=args.project)
     dataset_id = f"{args.project}.{args.dataset}"
     out = pathlib.Path(args.outdir)
 
+    if args.check:
+        sys.exit(check(client, dataset_id, args.dataset, out))
+
     # ---- Tables & Views: DDL + schema JSON
     ddl_sql = f"""
     SELECT table_name, table_type, ddl
@@ -54,6 +205,16 @@ def main():
     ORDER BY table_name
     """
     ddl_rows = list(client.query(ddl_sql).result())
+    modified = {
+        r["table_id"]: r["last_modified_time"]
+        for r in client.query(f"SELECT table_id, last_modified_time FROM `{dataset_id}.__TABLES__`").result()
+    }
+
+    state_path = pathlib.Path(args.state_file) if args.state_file else STATE_DIR / f"{dataset_id}.json"
+    state = {} if args.force else load_state(state_path)
+    new_state: dict[str, dict] = {}
+    to_fetch = []
+    written = 0
 
     for r in ddl_rows:
         table_name = r["table_name"]
@@ -63,22 +224,25 @@ def main():
         subdir = "ddl"  # keep views here too; optional: split to views/
         ddl_path = out / subdir / f"{args.dataset}.{table_name}.sql"
         if ddl:
-            write_text(ddl_path, ddl)
+            written += write_text(ddl_path, ddl)
 
-        # Write schema JSON for tables (views don't have data schema)
+        # Schema JSON for tables (views don't have data schema), unless unchanged since the last dump
         if table_type.upper() in ("BASE TABLE", "EXTERNAL"):
-            tbl_ref = f"{dataset_id}.{table_name}"
-            tbl = client.get_table(tbl_ref)
-            schema_json = {
-                "table": tbl_ref,
-                "type": table_type,
-                "partitioning": getattr(tbl, "time_partitioning", None).type_ if getattr(tbl, "time_partitioning", None) else None,
-                "partition_field": getattr(tbl, "time_partitioning", None).field if getattr(tbl, "time_partitioning", None) else None,
-                "clustering_fields": getattr(tbl, "clustering_fields", None),
-                "schema": to_schema_json(tbl.schema),
-            }
+            prev = state.get(table_name, {})
+            schema_path = out / "schema" / f"{args.dataset}.{table_name}.schema.json"
+            if prev.get("last_modified") == modified.get(table_name) and schema_path.exists():
+                new_state[table_name] = prev
+            else:
+                to_fetch.append((table_name, table_type))
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        fetched = pool.map(lambda t: table_schema_json(client, f"{dataset_id}.{t[0]}", t[1]), to_fetch)
+        for (table_name, _), schema_json in zip(to_fetch, fetched):
+            h = schema_hash(schema_json)
             schema_path = out / "schema" / f"{args.dataset}.{table_name}.schema.json"
-            write_json(schema_path, schema_json)
+            if h != state.get(table_name, {}).get("schema_hash") or not schema_path.exists():
+                written += write_json(schema_path, schema_json)
+            new_state[table_name] = {"last_modified": modified.get(table_name), "schema_hash": h}
 
     # ---- Routines (UDFs / Procedures): dump SQL if any
     try:
@@ -91,11 +255,13 @@ def main():
             name = r["routine_name"]
             definition = r["routine_definition"] or ""
             if definition:
-                write_text(out / "routines" / f"{args.dataset}.{name}.sql", definition)
+                written += write_text(out / "routines" / f"{args.dataset}.{name}.sql", definition)
     except Exception:
         pass  # dataset may have no routines, which is fine
 
-    print(f"✅ Wrote DDL & schema to {out.resolve()}")
+    write_json(state_path, new_state)
+    print(f"✅ Fetched {len(to_fetch)}/{len(new_state)} table schemas, "
+          f"updated {written} file(s) under {out.resolve()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,80 @@
+# check_concurrency.py
+"""
+Concurrency check for /trigger against the offline stubs.
+
+Fires concurrent cold /trigger calls for one date and checks that every call gets
+a 202 and exactly one execution starts. Then drops this instance's in-memory
+dedup (as a second instance would see it) and checks the running execution is
+still found via list_executions.
+
+Usage:
+  JOBS_CLIENT=stub python check_concurrency.py --rounds 6 --concurrency 8
+"""
+import argparse
+import os
+import sys
+import threading
+
+os.environ["JOBS_CLIENT"] = "stub"
+os.environ.setdefault("STUB_JOB_SECONDS", "30")
+
+from fastapi.testclient import TestClient
+
+import trigger_app
+
+
+def run_round(concurrency: int) -> list[str]:
+    # cold instance: no clients, nothing in flight
+    trigger_app._clients = None
+    trigger_app._inflight.clear()
+
+    barrier = threading.Barrier(concurrency)
+    responses = []
+
+    def fire():
+        with TestClient(trigger_app.app) as client:
+            barrier.wait()
+            responses.append(client.post("/trigger", params={"target_date": "2025-01-02"}))
+
+    threads = [threading.Thread(target=fire) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    problems = []
+    codes = sorted(r.status_code for r in responses)
+    if codes != [202] * concurrency:
+        problems.append(f"status codes {codes}")
+    jobs, _ = trigger_app.get_clients()
+    if jobs.run_count != 1:
+        problems.append(f"{jobs.run_count} executions started")
+    executions = {r.json().get("execution") for r in responses if r.status_code == 202}
+    if len(executions) != 1:
+        problems.append(f"{len(executions)} distinct executions returned")
+
+    # another instance: shares Cloud Run, not our _inflight
+    trigger_app._inflight.clear()
+    with TestClient(trigger_app.app) as client:
+        r = client.post("/trigger", params={"target_date": "2025-01-02"})
+    if r.status_code != 202 or r.json()["status"] != "already_running" or jobs.run_count != 1:
+        problems.append(f"cross-instance trigger: {r.status_code} {r.json()}, runs={jobs.run_count}")
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=6)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    failed = 0
+    for i in range(args.rounds):
+        problems = run_round(args.concurrency)
+        print(f"round {i + 1}: {'ok' if not problems else '; '.join(problems)}")
+        failed += bool(problems)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
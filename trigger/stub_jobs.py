@@ -0,0 +1,87 @@
+# stub_jobs.py
+"""
+Offline stand-ins for run_v2.JobsClient / ExecutionsClient (JOBS_CLIENT=stub).
+
+Executions finish STUB_JOB_SECONDS after they start, or when finish() is called,
+so trigger/status/dedup behaviour can be exercised without Cloud Run.
+"""
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+class StubJobsClient:
+    def __init__(self, duration: float | None = None):
+        self.duration = float(os.getenv("STUB_JOB_SECONDS", "2")) if duration is None else duration
+        self.executions: dict[str, dict] = {}
+        self.run_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def run_job(self, request=None, name=None):
+        request = request or {"name": name}
+        with self._lock:
+            self.run_count += 1
+            exec_name = f"{request['name']}/executions/stub-{next(self._ids)}"
+            self.executions[exec_name] = {
+                "request": request,
+                "started": time.monotonic(),
+                "create_time": datetime.now(timezone.utc),
+                "completion_time": None,
+                "succeeded": None,
+            }
+        execution = self._execution(exec_name)
+        return SimpleNamespace(metadata=execution, result=lambda timeout=None: self._wait(exec_name, timeout))
+
+    def finish(self, exec_name: str, succeeded: bool = True):
+        with self._lock:
+            e = self.executions[exec_name]
+            if e["completion_time"] is None:
+                e["completion_time"] = datetime.now(timezone.utc)
+                e["succeeded"] = succeeded
+
+    def _execution(self, exec_name: str):
+        e = self.executions[exec_name]
+        if e["completion_time"] is None and time.monotonic() - e["started"] >= self.duration:
+            self.finish(exec_name)
+        done = e["completion_time"] is not None
+        overrides = e["request"].get("overrides", {}).get("container_overrides", [])
+        containers = [SimpleNamespace(env=[SimpleNamespace(**v) for v in c.get("env", [])]) for c in overrides]
+        return SimpleNamespace(
+            name=exec_name,
+            template=SimpleNamespace(containers=containers),
+            create_time=e["create_time"],
+            completion_time=e["completion_time"],
+            running_count=0 if done else 1,
+            succeeded_count=1 if done and e["succeeded"] else 0,
+            failed_count=1 if done and not e["succeeded"] else 0,
+        )
+
+    def _wait(self, exec_name: str, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._execution(exec_name).completion_time is None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(exec_name)
+            time.sleep(0.05)
+        return self._execution(exec_name)
+
+
+class StubExecutionsClient:
+    def __init__(self, jobs: StubJobsClient):
+        self.jobs = jobs
+
+    def get_execution(self, request=None, name=None):
+        name = name or request["name"]
+        if name not in self.jobs.executions:
+            raise KeyError(name)
+        return self.jobs._execution(name)
+
+    def list_executions(self, request=None, parent=None):
+        parent = parent or request["parent"]
+        with self.jobs._lock:
+            names = [n for n in self.jobs.executions if n.startswith(parent + "/")]
+        # newest first, like Cloud Run
+        return [self.jobs._execution(n) for n in reversed(names)]
@@ -1,26 +1,142 @@
-from fastapi import FastAPI
-from google.cloud import run_v2
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
+from datetime import date, datetime, timedelta
+from typing import Optional
 import os
+import threading
 
 app = FastAPI()
 
+PROJECT_ID = os.getenv("PROJECT_ID", "fantasy-survivor-app")
+LOCATION = os.getenv("REGION", "us-central1")
+JOB_NAME = os.getenv("JOB_NAME", "nba-daily-ingest")
+JOB_PATH = f"projects/{PROJECT_ID}/locations/{LOCATION}/jobs/{JOB_NAME}"
+
+# How many of the job's most recent executions to scan for a run of the same date
+RECENT_EXECUTIONS = int(os.getenv("DEDUP_RECENT_EXECUTIONS", "20"))
+
+# target_date -> execution name of the run started by this instance
+_inflight: dict[str, str] = {}
+_lock = threading.Lock()
+_clients = None
+_clients_lock = threading.Lock()
+
+def get_clients():
+    """
+    (JobsClient, ExecutionsClient); JOBS_CLIENT=stub uses the offline stubs.
+    """
+    global _clients
+    with _clients_lock:
+        if _clients is None:
+            if os.getenv("JOBS_CLIENT") == "stub":
+                from stub_jobs import StubJobsClient, StubExecutionsClient
+                jobs = StubJobsClient()
+                _clients = (jobs, StubExecutionsClient(jobs))
+            else:
+                from google.cloud import run_v2
+                _clients = (run_v2.JobsClient(), run_v2.ExecutionsClient())
+        return _clients
+
+def _execution_status(execution) -> dict:
+    if not execution.completion_time:
+        state = "running"
+    elif execution.failed_count:
+        state = "failed"
+    else:
+        state = "succeeded"
+    return {
+        "execution": execution.name,
+        "state": state,
+        "running": execution.running_count,
+        "succeeded": execution.succeeded_count,
+        "failed": execution.failed_count,
+        "create_time": str(execution.create_time) if execution.create_time else None,
+        "completion_time": str(execution.completion_time) if execution.completion_time else None,
+    }
+
+def _get_status(exec_name: str) -> dict:
+    _, executions = get_clients()
+    return _execution_status(executions.get_execution(name=exec_name))
+
+def _target_date_of(execution) -> Optional[str]:
+    for container in execution.template.containers:
+        for env in container.env:
+            if env.name == "TARGET_DATE":
+                return env.value
+    return None
+
+def _running_execution_for(key: str) -> Optional[str]:
+    """
+    A running execution of the job for target_date key, started by any instance
+    (scheduler retries can land on another one). Scans the most recent executions.
+    """
+    _, executions = get_clients()
+    for i, execution in enumerate(executions.list_executions(request={"parent": JOB_PATH})):
+        if i >= RECENT_EXECUTIONS:
+            break
+        if not execution.completion_time and _target_date_of(execution) == key:
+            return execution.name
+    return None
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
 @app.post("/trigger")
-def trigger_job():
+def trigger_job(target_date: Optional[str] = Query(None, description="YYYY-MM-DD, default yesterday")):
     """
-    Trigger the nba-daily-ingest Cloud Run job via API.
+    Start the nba-daily-ingest Cloud Run job for target_date and return as soon as
+    the execution is accepted. While a run for that date is still in flight (started
+    here or by another instance), the existing execution is returned instead.
     """
-    project_id = os.getenv("PROJECT_ID", "fantasy-survivor-app")
-    location = os.getenv("REGION", "us-central1")
-    job_name = os.getenv("JOB_NAME", "nba-daily-ingest")
+    try:
+        d = datetime.strptime(target_date, "%Y-%m-%d").date() if target_date else date.today() - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{target_date}'. Use YYYY-MM-DD.")
+    key = d.isoformat()
+
+    jobs, _ = get_clients()
+    with _lock:
+        existing = _inflight.get(key)
+        try:
+            running = existing is not None and _get_status(existing)["state"] == "running"
+        except Exception:
+            running = False  # lookup failed; fall back to listing the job's executions
+        if not running:
+            existing = _running_execution_for(key)
+            running = existing is not None
+        if running:
+            _inflight[key] = existing
+            return JSONResponse(status_code=202, content={
+                "status": "already_running", "job": JOB_NAME, "target_date": key, "execution": existing,
+            })
+
+        operation = jobs.run_job(request={
+            "name": JOB_PATH,
+            "overrides": {"container_overrides": [{"env": [{"name": "TARGET_DATE", "value": key}]}]},
+        })
+        exec_name = operation.metadata.name
+        _inflight[key] = exec_name
 
-    client = run_v2.JobsClient()
-    job_path = f"projects/{project_id}/locations/{location}/jobs/{job_name}"
+    return JSONResponse(status_code=202, content={
+        "status": "accepted", "job": JOB_NAME, "target_date": key, "execution": exec_name,
+    })
 
-    operation = client.run_job(name=job_path)
-    response = operation.result()
+@app.get("/status")
+def execution_status(
+    execution: Optional[str] = Query(None, description="Execution name or id returned by /trigger"),
+    target_date: Optional[str] = Query(None, description="YYYY-MM-DD of a triggered run"),
+):
+    exec_name = None
+    if execution:
+        exec_name = execution if "/" in execution else f"{JOB_PATH}/executions/{execution}"
+    elif target_date:
+        # started here, or a run still going that another instance started
+        exec_name = _inflight.get(target_date) or _running_execution_for(target_date)
+    if exec_name is None:
+        raise HTTPException(status_code=404, detail="Unknown execution; pass execution or a triggered target_date.")
 
-    return {"status": "success", "job": job_name, "execution": response.name}
+    try:
+        return _get_status(exec_name)
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Execution lookup failed: {e}")